@@ -1,55 +1,84 @@
 import os
-# AGGRESSIVE FIX: Strip all proxy settings BEFORE any other imports
-# This prevents the 'Client.__init__ proxies' error in Google GenAI SDK
-for var in ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy']:
-    os.environ.pop(var, None)
+import datetime
+import json
+import logging
+import re
+import threading
 
-from dotenv import load_dotenv
-load_dotenv()
+from parser.providers import load_environment
+# Read .env and strip proxy settings before anything can build a provider client
+load_environment()
 
-from flask import Flask, render_template, request, redirect, url_for, flash, Response, stream_with_context, session
+from flask import Blueprint, Flask, render_template, request, redirect, url_for, flash, Response, stream_with_context, session
 from flask_pymongo import PyMongo
 from flask_login import LoginManager, UserMixin, login_user, current_user, login_required, logout_user
 from flask_bcrypt import Bcrypt
 from bson import ObjectId
-import markdown
-import json
-import feedparser
-import requests
-import re
 
+# These modules are cheap to import: provider SDKs, PDF/DOCX/OCR libraries,
+# markdown, numpy and feedparser are imported where they are first used.
 from parser.file_reader import read_file
-from parser.simplifier import simplify_text, simplify_text_stream
+from parser.simplifier import simplify_text, simplify_text_stream, compare_documents_stream
 from parser.chat_engine import chat_with_gemini_stream, chat_with_groq_stream, get_constitution_text
-import datetime
+from parser.streaming import sse_event, stream_markdown_sse, stream_json_sse
+from parser.risk_analyzer import analyze_text
+from parser.comparator import align_documents, format_differences_for_prompt
+from parser.scheduler import (FairScheduler, MongoQuotaStore, QuotaExceeded, PRIORITY_BULK,
+                              PRIORITY_INTERACTIVE, PRIORITY_STANDARD, estimate_input_tokens)
+
+
+def mongo_uri_from_env():
+    """MongoDB URI from the environment, with the "legalclause" database name ensured."""
+    mongo_uri = os.environ.get("MONGO_URI") or os.environ.get("MONGODB_URI")
+    if not mongo_uri:
+        raise RuntimeError("No MongoDB URI found. Set MONGO_URI in .env")
+
+    # Ensure the database name "legalclause" is included in the URI
+    if "mongodb.net" in mongo_uri and "/legalclause" not in mongo_uri:
+        if "?" in mongo_uri:
+            mongo_uri = mongo_uri.replace(".net/", ".net/legalclause")
+            if ".net/?" in mongo_uri:
+                mongo_uri = mongo_uri.replace(".net/?", ".net/legalclause?")
+        else:
+            mongo_uri = mongo_uri.rstrip("/") + "/legalclause"
+    return mongo_uri
 
-app = Flask(__name__, static_folder="static", template_folder="templates")
-app.secret_key = os.environ.get("SECRET_KEY", "dev-secret")
 
-# Production-ready MongoDB connection
-mongo_uri = os.environ.get("MONGO_URI") or os.environ.get("MONGODB_URI")
-if not mongo_uri:
-    raise RuntimeError("No MongoDB URI found. Set MONGO_URI in .env")
+class LazyMongo:
+    """
+    Flask-PyMongo, set up on first use instead of at startup.
+    Parsing a mongodb+srv:// URI does blocking DNS lookups, and a client
+    created before gunicorn forks must not be shared by the workers, so each
+    worker builds its own client when it first touches the database.
+    """
 
-# Ensure the database name "legalclause" is included in the URI
-if "mongodb.net" in mongo_uri and "/legalclause" not in mongo_uri:
-    if "?" in mongo_uri:
-        mongo_uri = mongo_uri.replace(".net/", ".net/legalclause")
-        if ".net/?" in mongo_uri:
-            mongo_uri = mongo_uri.replace(".net/?", ".net/legalclause?")
-    else:
-        mongo_uri = mongo_uri.rstrip("/") + "/legalclause"
+    def __init__(self):
+        self.app = None
+        self._mongo = None
+        self._lock = threading.Lock()
 
-app.config["MONGO_URI"] = mongo_uri
-app.config["MONGO_CONNECT_TIMEOUT_MS"] = 30000
-app.config["MONGO_SERVER_SELECTION_TIMEOUT_MS"] = 30000
+    def init_app(self, app):
+        self.app = app
+        self._mongo = None
 
-mongo = PyMongo(app)
-bcrypt = Bcrypt(app)
+    @property
+    def db(self):
+        if self._mongo is None:
+            with self._lock:
+                if self._mongo is None:
+                    self._mongo = PyMongo(self.app)
+        return self._mongo.db
 
-login_manager = LoginManager(app)
-login_manager.login_view = "login"
+
+mongo = LazyMongo()
+bcrypt = Bcrypt()
+login_manager = LoginManager()
+login_manager.login_view = "main.login"
 login_manager.login_message_category = "info"
+# Every provider call goes through this; see parser/scheduler.py
+scheduler = FairScheduler()
+
+main = Blueprint("main", __name__)
 
 class User(UserMixin):
     def __init__(self, doc):
@@ -66,33 +95,33 @@ def load_user(user_id):
 
 WHITELIST = {"login", "register", "static", "favicon"}
 
-@app.before_request
+@main.before_app_request
 def require_login_for_all():
     endpoint = (request.endpoint or "").split(".")[-1]
     if endpoint in WHITELIST or (request.endpoint or "").startswith("static"):
         return
     if current_user.is_authenticated:
         return
-    return redirect(url_for("login", next=request.path))
+    return redirect(url_for("main.login", next=request.path))
 
-@app.route("/register", methods=["GET", "POST"])
+@main.route("/register", methods=["GET", "POST"])
 def register():
     if request.method == "POST":
         email = request.form.get("email", "").strip().lower()
         password = request.form.get("password", "")
         if not email or not password:
             flash("Please provide email and password", "warning")
-            return redirect(url_for("register"))
+            return redirect(url_for("main.register"))
         if mongo.db.users.find_one({"email": email}):
             flash("Email already registered", "danger")
-            return redirect(url_for("register"))
+            return redirect(url_for("main.register"))
         hashpw = bcrypt.generate_password_hash(password).decode()
         mongo.db.users.insert_one({"email": email, "password": hashpw})
         flash("Registered! Please log in.", "success")
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
     return render_template("register.html")
 
-@app.route("/login", methods=["GET", "POST"])
+@main.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "POST":
         email = request.form.get("email", "").strip().lower()
@@ -105,24 +134,24 @@ def login():
             next_page = request.form.get("next") or request.args.get("next")
             if next_page and next_page.startswith("/"):
                 return redirect(next_page)
-            return redirect(url_for("home"))
+            return redirect(url_for("main.home"))
         flash("Invalid email or password", "danger")
-        return redirect(url_for("login"))
+        return redirect(url_for("main.login"))
     return render_template("login.html")
 
-@app.route("/logout")
+@main.route("/logout")
 @login_required
 def logout():
     logout_user()
     flash("Logged out", "info")
-    return redirect(url_for("login"))
+    return redirect(url_for("main.login"))
 
-@app.route("/")
+@main.route("/")
 @login_required
 def home():
     return render_template("home.html")
 
-@app.route("/upload", methods=['GET', 'POST'])
+@main.route("/upload", methods=['GET', 'POST'])
 @login_required
 def upload():
     if request.method == 'POST':
@@ -135,21 +164,50 @@ def upload():
                 text = read_file(file)
                 if text.startswith("Error:"):
                     flash(text, "danger")
-                    return redirect(url_for('upload'))
+                    return redirect(url_for('main.upload'))
             except Exception as e:
                 flash(f"Error processing document: {str(e)}", "danger")
-                return redirect(url_for('upload'))
+                return redirect(url_for('main.upload'))
         elif text_input:
             text = text_input
         else:
             flash("No file or text provided", "warning")
-            return redirect(url_for('upload'))
+            return redirect(url_for('main.upload'))
         
-        return render_template('result.html', original_text=text)
+        return render_template('result.html', original_text=text, risk=analyze_text(text))
         
     return render_template('upload.html')
 
-@app.route('/stream_analysis', methods=['POST'])
+def sse_response(events):
+    # Closing the response (client abort) closes `events`, which aborts the LLM call
+    return Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+def admit(priority, *texts):
+    """Wait for a provider slot for the current user. Raises QuotaExceeded."""
+    user = current_user.get_id() or request.remote_addr
+    return scheduler.acquire(user, priority, estimate_input_tokens(*texts))
+
+def scheduled(ticket, response):
+    # The slot is held while the answer streams and freed when the response closes
+    response.call_on_close(ticket.release)
+    return response
+
+@main.errorhandler(QuotaExceeded)
+def quota_exceeded(e):
+    return Response(f"{e} Please try again in {e.retry_after} seconds.", status=429,
+                    headers={'Retry-After': str(e.retry_after)}, mimetype='text/plain')
+
+@main.route('/api/quota')
+@login_required
+def quota():
+    usage = scheduler.usage(current_user.get_id() or request.remote_addr)
+    return Response(json.dumps(usage), mimetype='application/json')
+
+@main.route('/stream_analysis', methods=['POST'])
 @login_required
 def stream_analysis():
     data = request.get_json()
@@ -158,20 +216,81 @@ def stream_analysis():
     if not text:
         return Response("No text provided", status=400)
 
+    # The local scan takes milliseconds and narrows what the LLM has to cover
+    risk_report = analyze_text(text)
+    ticket = admit(PRIORITY_BULK, text)
+
     def generate():
-        for chunk in simplify_text_stream(text):
+        for chunk in ticket.track(simplify_text_stream(text, risk_report, on_plan=ticket.charge)):
             yield chunk
 
-    return Response(stream_with_context(generate()), mimetype='text/plain')
+    return scheduled(ticket, Response(stream_with_context(generate()), mimetype='text/plain'))
 
-from parser.chat_engine import chat_with_gemini_stream
+def read_document(file, text_input):
+    """Text of an uploaded file, or the pasted text. Raises ValueError on unreadable input."""
+    if file and file.filename:
+        text = read_file(file)
+        if text.startswith("Error"):
+            raise ValueError(text)
+        return text
+    return text_input or ""
 
-@app.route('/chat')
+@main.route('/compare', methods=['GET', 'POST'])
+@login_required
+def compare():
+    if request.method == 'POST':
+        try:
+            text_a = read_document(request.files.get('file_a'), request.form.get('text_a', ''))
+            text_b = read_document(request.files.get('file_b'), request.form.get('text_b', ''))
+        except Exception as e:
+            flash(f"Error processing document: {str(e)}", "danger")
+            return redirect(url_for('main.compare'))
+
+        if not text_a.strip() or not text_b.strip():
+            flash("Please provide both documents to compare", "warning")
+            return redirect(url_for('main.compare'))
+
+        return render_template('compare.html', text_a=text_a, text_b=text_b,
+                               report=align_documents(text_a, text_b))
+
+    return render_template('compare.html')
+
+@main.route('/stream_compare', methods=['POST'])
+@login_required
+def stream_compare():
+    data = request.get_json()
+    text_a = data.get('text_a') if data else None
+    text_b = data.get('text_b') if data else None
+
+    if not text_a or not text_b:
+        return Response("Both documents are required", status=400)
+
+    report = align_documents(text_a, text_b)
+    ticket = admit(PRIORITY_BULK, format_differences_for_prompt(report))
+
+    def generate():
+        yield sse_event("alignment", {"stats": report["stats"], "elapsed_ms": report["elapsed_ms"]})
+        yield from stream_markdown_sse(ticket.track(compare_documents_stream(report, on_plan=ticket.charge)))
+
+    return scheduled(ticket, sse_response(generate()))
+
+@main.route('/api/risk_scan', methods=['POST'])
+@login_required
+def risk_scan():
+    data = request.get_json()
+    text = data.get('text') if data else None
+
+    if not text:
+        return Response("No text provided", status=400)
+
+    return Response(json.dumps(analyze_text(text)), mimetype='application/json')
+
+@main.route('/chat')
 @login_required
 def chat():
     return render_template('chat.html')
 
-@app.route('/chat_api', methods=['POST'])
+@main.route('/chat_api', methods=['POST'])
 @login_required
 def chat_api():
     try:
@@ -182,36 +301,40 @@ def chat_api():
         if not message:
             return Response("No message provided", status=400)
 
+        ticket = admit(PRIORITY_INTERACTIVE, message, *[msg.get('content', '') for msg in history])
+
         def generate():
             try:
-                for chunk in chat_with_gemini_stream(message, history):
+                for chunk in ticket.track(chat_with_gemini_stream(message, history, on_plan=ticket.charge)):
                     yield chunk
             except Exception as e:
                 print(f"Error in chat stream: {e}")
                 yield f"Error: {str(e)}"
 
-        return Response(stream_with_context(generate()), mimetype='text/plain')
+        return scheduled(ticket, Response(stream_with_context(generate()), mimetype='text/plain'))
+    except QuotaExceeded:
+        raise
     except Exception as e:
         print(f"Error in chat_api: {e}")
         return Response(str(e), status=500)
 
-@app.route('/news')
+@main.route('/news')
 @login_required
 def news():
     return render_template('news.html')
 
-@app.route('/learning')
+@main.route('/learning')
 @login_required
 def learning():
     return render_template('learning.html')
 
-@app.route('/learning/law')
+@main.route('/learning/law')
 @login_required
 def learning_law():
     track_progress('law')
     return render_template('learning_law.html')
 
-@app.route('/learning/law/<law_name>')
+@main.route('/learning/law/<law_name>')
 @login_required
 def learning_law_view(law_name):
     # Sample data for Articles/Sections
@@ -238,7 +361,7 @@ def learning_law_view(law_name):
     items = data.get(law_name, [])
     return render_template('learning_law_view.html', law_name=law_name, items=items)
 
-@app.route('/learning/law/<law_name>/<item_id>')
+@main.route('/learning/law/<law_name>/<item_id>')
 @login_required
 def learning_content(law_name, item_id):
     # In a real app, we'd fetch the original text from a DB or PDF.
@@ -274,9 +397,12 @@ def learning_content(law_name, item_id):
     }}
     """
     
+    ticket = admit(PRIORITY_STANDARD, prompt)
     try:
         # Using a non-streaming helper for this specific task
-        response_text = "".join(chat_with_groq_stream(prompt, system_instruction="You are a legal educator. Return ONLY JSON."))
+        chunks = chat_with_groq_stream(prompt, system_instruction="You are a legal educator. Return ONLY JSON.",
+                                       on_plan=ticket.charge)
+        response_text = "".join(ticket.track(chunks))
         # Basic JSON extraction in case AI adds markdown
         json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
         if json_match:
@@ -294,8 +420,10 @@ def learning_content(law_name, item_id):
     except Exception as e:
         print(f"Error generating learning content: {e}")
         return "Error loading content. Please try again later.", 500
+    finally:
+        ticket.release()
 
-@app.route('/learning/case')
+@main.route('/learning/case')
 @login_required
 def learning_case():
     track_progress('case')
@@ -303,11 +431,10 @@ def learning_case():
     scenario = "Rahul was walking home at night when a police officer stopped him and arrested him without telling him the reason for the arrest. Rahul was not allowed to call his lawyer or family for 24 hours."
     return render_template('learning_case.html', scenario=scenario)
 
-@app.route('/api/learning/evaluate-case', methods=['POST'])
-@login_required
-def evaluate_case():
-    data = request.json
-    prompt = f"""
+CASE_EVALUATOR_INSTRUCTION = "You are a legal evaluator. Return ONLY JSON."
+
+def build_case_prompt(data):
+    return f"""
     Scenario: {data['scenario']}
     User's Answer (Clause): {data['user_clause']}
     User's Reasoning: {data['user_reasoning']}
@@ -325,24 +452,48 @@ def evaluate_case():
         "explanation": "..."
     }}
     """
+
+def parse_json_answer(response_text):
+    # Basic JSON extraction in case AI adds markdown
+    json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
+    if not json_match:
+        raise ValueError("No JSON found")
+    return json.loads(json_match.group())
+
+@main.route('/api/learning/evaluate-case', methods=['POST'])
+@login_required
+def evaluate_case():
+    prompt = build_case_prompt(request.json)
+    ticket = admit(PRIORITY_STANDARD, prompt)
     try:
-        response_text = "".join(chat_with_groq_stream(prompt, system_instruction="You are a legal evaluator. Return ONLY JSON."))
+        chunks = chat_with_groq_stream(prompt, system_instruction=CASE_EVALUATOR_INSTRUCTION, on_plan=ticket.charge)
+        response_text = "".join(ticket.track(chunks))
         json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
         return Response(json_match.group(), mimetype='application/json')
     except Exception as e:
         return json.dumps({"error": str(e)}), 500
+    finally:
+        ticket.release()
 
-@app.route('/learning/exam')
+@main.route('/api/learning/evaluate-case/stream', methods=['POST'])
+@login_required
+def evaluate_case_stream():
+    prompt = build_case_prompt(request.json)
+    ticket = admit(PRIORITY_STANDARD, prompt)
+    chunks = ticket.track(chat_with_groq_stream(prompt, system_instruction=CASE_EVALUATOR_INSTRUCTION,
+                                                on_plan=ticket.charge))
+    return scheduled(ticket, sse_response(stream_json_sse(chunks, parse_json_answer)))
+
+@main.route('/learning/exam')
 @login_required
 def learning_exam():
     track_progress('exam')
     return render_template('learning_exam.html')
 
-@app.route('/api/learning/generate-exam-answer', methods=['POST'])
-@login_required
-def generate_exam_answer():
-    data = request.json
-    prompt = f"""
+EXAM_TUTOR_INSTRUCTION = "You are a law professor helping a student. Use markdown for headings."
+
+def build_exam_prompt(data):
+    return f"""
     Law: {data['law']}
     Topic: {data['topic']}
     Marks: {data['marks']}
@@ -357,13 +508,31 @@ def generate_exam_answer():
 
     Keep the language simple but professional.
     """
+
+@main.route('/api/learning/generate-exam-answer', methods=['POST'])
+@login_required
+def generate_exam_answer():
+    prompt = build_exam_prompt(request.json)
+    ticket = admit(PRIORITY_STANDARD, prompt)
     try:
-        answer = "".join(chat_with_groq_stream(prompt, system_instruction="You are a law professor helping a student. Use markdown for headings."))
+        chunks = chat_with_groq_stream(prompt, system_instruction=EXAM_TUTOR_INSTRUCTION, on_plan=ticket.charge)
+        answer = "".join(ticket.track(chunks))
         return json.dumps({"answer": answer})
     except Exception as e:
         return json.dumps({"error": str(e)}), 500
+    finally:
+        ticket.release()
 
-@app.route('/learning/daily')
+@main.route('/api/learning/generate-exam-answer/stream', methods=['POST'])
+@login_required
+def generate_exam_answer_stream():
+    prompt = build_exam_prompt(request.json)
+    ticket = admit(PRIORITY_STANDARD, prompt)
+    chunks = ticket.track(chat_with_groq_stream(prompt, system_instruction=EXAM_TUTOR_INSTRUCTION,
+                                                on_plan=ticket.charge))
+    return scheduled(ticket, sse_response(stream_markdown_sse(chunks)))
+
+@main.route('/learning/daily')
 @login_required
 def learning_daily():
     track_progress('daily')
@@ -398,7 +567,7 @@ def learning_daily():
     
     return render_template('learning_daily.html', concept=concept, date=datetime.datetime.now().strftime("%B %d, %Y"))
 
-@app.route('/learning/progress')
+@main.route('/learning/progress')
 @login_required
 def learning_progress():
     progress = session.get('learning_progress', {})
@@ -418,23 +587,27 @@ def track_progress(mode):
 
 
 
-@app.route('/api/news')
+# Overridable so benchmarks can serve feeds from the local mock server
+NEWS_FEED_BASE_URL = os.environ.get("NEWS_FEED_BASE_URL", "https://www.thehindu.com")
+
+@main.route('/api/news')
 @login_required
 def get_news():
     category = request.args.get('category', 'national')
     rss_urls = {
-        'national': 'https://www.thehindu.com/news/national/feeder/default.rss',
-        'international': 'https://www.thehindu.com/news/international/feeder/default.rss',
-        'business': 'https://www.thehindu.com/business/feeder/default.rss',
-        'sport': 'https://www.thehindu.com/sport/feeder/default.rss',
-        'entertainment': 'https://www.thehindu.com/entertainment/feeder/default.rss',
-        'science': 'https://www.thehindu.com/sci-tech/science/feeder/default.rss'
+        'national': f'{NEWS_FEED_BASE_URL}/news/national/feeder/default.rss',
+        'international': f'{NEWS_FEED_BASE_URL}/news/international/feeder/default.rss',
+        'business': f'{NEWS_FEED_BASE_URL}/business/feeder/default.rss',
+        'sport': f'{NEWS_FEED_BASE_URL}/sport/feeder/default.rss',
+        'entertainment': f'{NEWS_FEED_BASE_URL}/entertainment/feeder/default.rss',
+        'science': f'{NEWS_FEED_BASE_URL}/sci-tech/science/feeder/default.rss'
     }
 
     
     url = rss_urls.get(category, rss_urls['national'])
     
     try:
+        import feedparser
         feed = feedparser.parse(url)
         news_items = []
         for entry in feed.entries:
@@ -450,7 +623,6 @@ def get_news():
             
             # Fallback for image in description or summary
             if not image_url and 'summary' in entry:
-                import re
                 img_match = re.search(r'<img src="([^"]+)"', entry.summary)
                 if img_match:
                     image_url = img_match.group(1)
@@ -466,5 +638,43 @@ def get_news():
     except Exception as e:
         return json.dumps({'error': str(e)}), 500
 
+def create_app(preload_corpus=None):
+    """
+    Build the Flask app. Nothing here touches the network: MongoDB connects
+    on first use and provider SDKs load on the first LLM call.
+
+    With `preload_corpus` (default: the PRELOAD_CORPUS env var) the
+    Constitution text is extracted now, so under `gunicorn --preload` the
+    master does it once and the forked workers share it.
+    """
+    app = Flask(__name__, static_folder="static", template_folder="templates")
+    app.secret_key = os.environ.get("SECRET_KEY", "dev-secret")
+
+    # Surfaces per-request token budget decisions (parser.token_budget) in the worker logs
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    # Production-ready MongoDB connection
+    app.config["MONGO_URI"] = mongo_uri_from_env()
+    app.config["MONGO_CONNECT_TIMEOUT_MS"] = 30000
+    app.config["MONGO_SERVER_SELECTION_TIMEOUT_MS"] = 30000
+
+    mongo.init_app(app)
+    bcrypt.init_app(app)
+    login_manager.init_app(app)
+    app.register_blueprint(main)
+
+    if os.environ.get("LLM_QUOTA_PERSIST", "").lower() in ("1", "true", "yes"):
+        scheduler.store = MongoQuotaStore(lambda: mongo.db.llm_quotas)
+
+    if preload_corpus is None:
+        preload_corpus = os.environ.get("PRELOAD_CORPUS", "").lower() in ("1", "true", "yes")
+    if preload_corpus:
+        get_constitution_text()
+    return app
+
+
+app = create_app()
+
 if __name__ == "__main__":
     app.run(debug=True, use_reloader=True)
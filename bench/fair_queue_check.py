@@ -0,0 +1,123 @@
+"""
+Check that the LLM queue limits fit the default gunicorn config.
+
+One gthread worker is a fixed pool of `threads` threads; a request that
+finds them all busy waits in the backlog, first come first served, before
+the scheduler ever sees it. This check builds the app's FairScheduler with
+its environment defaults, fits it to the `threads` from gunicorn.conf.py as
+post_fork does, and replays a burst against a pool of that size: bulk
+analyses from many users fill every slot and the queue and overflow it,
+then one chat message and one page load arrive.
+
+It fails unless the chat is admitted and served before all bulk work that
+was queued ahead of it, the overflow is answered 429 at once instead of
+waiting for a thread, and the page load is not held up by the LLM calls. No MongoDB,
+mock server or provider access is needed.
+
+Usage:
+    python -m bench.fair_queue_check
+    GUNICORN_THREADS=16 python -m bench.fair_queue_check --hold 0.5
+"""
+import argparse
+import os
+import runpy
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.run_benchmarks import ROOT
+from parser.scheduler import FairScheduler, QuotaExceeded, PRIORITY_BULK, PRIORITY_INTERACTIVE
+
+
+def default_threads():
+    """Threads per worker as gunicorn.conf.py configures them."""
+    return runpy.run_path(os.path.join(ROOT, "gunicorn.conf.py"))["threads"]
+
+
+def run_burst(threads, hold):
+    scheduler = FairScheduler()
+    scheduler.fit_threads(threads)
+    granted = []
+    lock = threading.Lock()
+
+    def call(user, priority):
+        submitted = time.monotonic()
+        try:
+            ticket = scheduler.acquire(user, priority, 500)
+        except QuotaExceeded:
+            return {"user": user, "status": 429, "wait_s": time.monotonic() - submitted}
+        with lock:
+            granted.append(user)
+        wait = time.monotonic() - submitted
+        time.sleep(hold)
+        ticket.release()
+        return {"user": user, "status": 200, "wait_s": wait}
+
+    def page(submitted):
+        # A page load only needs a free thread
+        return time.monotonic() - submitted
+
+    bulk_calls = scheduler.max_concurrent + scheduler.max_queue + threads
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = []
+        for i in range(bulk_calls):
+            futures.append(pool.submit(call, f"bulk-{i}", PRIORITY_BULK))
+            # Keep arrival order, so the queue fills before the overflow comes in
+            time.sleep(0.005)
+        chat = pool.submit(call, "chat", PRIORITY_INTERACTIVE)
+        page_wait = pool.submit(page, time.monotonic()).result()
+        results = [f.result() for f in futures]
+        chat_result = chat.result()
+
+    return {
+        "threads": threads,
+        "max_concurrent": scheduler.max_concurrent,
+        "max_queue": scheduler.max_queue,
+        "bulk_served": sum(1 for r in results if r["status"] == 200),
+        "bulk_rejected": [r for r in results if r["status"] == 429],
+        "chat": chat_result,
+        "chat_position": granted.index("chat") if "chat" in granted else None,
+        "page_wait_s": page_wait,
+    }
+
+
+def find_problems(report, hold):
+    problems = []
+    if report["chat"]["status"] != 200:
+        problems.append("the chat message was rejected")
+    elif report["chat_position"] != report["max_concurrent"]:
+        problems.append(f"chat was call {report['chat_position'] + 1} to get a slot; "
+                        f"expected it right after the {report['max_concurrent']} running bulk calls")
+    slow_rejections = [r for r in report["bulk_rejected"] if r["wait_s"] > hold / 2]
+    if not report["bulk_rejected"]:
+        problems.append("the overflow was never rejected; the queue is larger than the threads can hold")
+    elif slow_rejections:
+        problems.append(f"{len(slow_rejections)} overflow calls waited for a thread before their 429")
+    if report["page_wait_s"] > hold / 2:
+        problems.append(f"the page load waited {report['page_wait_s']:.2f}s for a thread")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fair-queue check against the default gunicorn config")
+    parser.add_argument("--threads", type=int, help="threads per worker (default: from gunicorn.conf.py)")
+    parser.add_argument("--hold", type=float, default=1.0, help="seconds each simulated LLM call lasts")
+    args = parser.parse_args()
+
+    report = run_burst(args.threads or default_threads(), args.hold)
+    print(f"threads {report['threads']}: {report['max_concurrent']} running, {report['max_queue']} queued")
+    print(f"bulk: {report['bulk_served']} served, {len(report['bulk_rejected'])} rejected with 429")
+    print(f"chat: waited {report['chat']['wait_s']:.2f}s, slot {report['chat_position']}")
+    print(f"page: waited {report['page_wait_s']:.3f}s")
+
+    problems = find_problems(report, args.hold)
+    if problems:
+        print("\nFair-queue checks failed:")
+        for line in problems:
+            print(f"  {line}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
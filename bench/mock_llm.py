@@ -0,0 +1,380 @@
+"""
+Local mock LLM server for offline benchmarking.
+
+Speaks enough of the Groq (OpenAI-compatible) and Gemini streaming protocols
+for the app's SDK clients, plus a static RSS feed for /api/news.
+
+Modes:
+    synthetic  stream a canned markdown answer at a configurable token rate
+    record     proxy to the real providers and save transcripts (needs network)
+    replay     stream saved transcripts back with their recorded timing
+
+Point the app at it with:
+    GROQ_BASE_URL=http://127.0.0.1:8765
+    GEMINI_BASE_URL=http://127.0.0.1:8765/
+    NEWS_FEED_BASE_URL=http://127.0.0.1:8765
+
+Usage:
+    python -m bench.mock_llm --token-rate 80 --latency 0.4 --failure-rate 0.05
+    python -m bench.mock_llm --mode record --transcripts bench/transcripts.jsonl
+    python -m bench.mock_llm --mode replay --transcripts bench/transcripts.jsonl
+"""
+import argparse
+import collections
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GROQ_UPSTREAM = "https://api.groq.com"
+GEMINI_UPSTREAM = "https://generativelanguage.googleapis.com"
+
+SYNTHETIC_ANSWER = """# Rental Agreement
+
+**🔍 What is this?**
+An agreement letting the tenant live in the flat for 11 months in exchange for monthly rent.
+
+**👥 Who is it for?**
+*   The tenant and the landlord named in the agreement.
+
+**✅ Key Benefits / Obligations**
+*   Pay rent of Rs. 15,000 by the 5th of every month.
+*   Keep the premises in good condition.
+*   The security deposit is refunded within 30 days of leaving.
+
+**❌ Exclusions / Risks**
+*   The landlord may end the agreement with one month's notice.
+*   A late fee of Rs. 500 per day applies after the due date.
+*   Disputes go to arbitration in Mumbai.
+
+**📝 How to Proceed**
+*   Read the termination clause carefully before signing.
+*   Keep receipts for every rent payment.
+
+**📅 Important Dates**
+*   Starts 1 April 2025 and renews automatically unless cancelled.
+"""
+
+RSS_ITEM = """    <item>
+      <title>Supreme Court hears matter {n}</title>
+      <link>https://example.invalid/news/{n}</link>
+      <description>&lt;img src="https://example.invalid/img/{n}.jpg"&gt; Summary of legal development {n}.</description>
+      <pubDate>Mon, 06 Jan 2025 10:{n:02d}:00 +0530</pubDate>
+    </item>
+"""
+
+
+def tokenize(text):
+    """Split text into word-sized pieces that concatenate back to the original."""
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+def request_key(provider, body):
+    """Stable key for a request: provider plus a hash of the prompt payload."""
+    payload = body.get("messages") if provider == "groq" else body.get("contents")
+    extra = body.get("systemInstruction") or body.get("system_instruction")
+    digest = hashlib.sha256(json.dumps([payload, extra], sort_keys=True).encode()).hexdigest()
+    return f"{provider}:{digest[:16]}"
+
+
+class TranscriptStore:
+    """JSONL store of recorded streams: one {key, provider, chunks} object per line."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.transcripts = {}
+        if path:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            record = json.loads(line)
+                            self.transcripts[record["key"]] = record
+            except FileNotFoundError:
+                pass
+
+    def get(self, key):
+        return self.transcripts.get(key)
+
+    def save(self, key, provider, chunks):
+        record = {"key": key, "provider": provider, "chunks": chunks}
+        with self.lock:
+            self.transcripts[key] = record
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+
+
+class MockConfig:
+    def __init__(self, mode="synthetic", token_rate=50.0, latency=0.3, jitter=0.0,
+                 failure_rate=0.0, stream_failure_rate=0.0, max_tokens=None,
+                 transcripts=None, replay_speed=1.0, seed=None):
+        self.mode = mode
+        self.token_rate = token_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.stream_failure_rate = stream_failure_rate
+        self.max_tokens = max_tokens
+        self.store = TranscriptStore(transcripts)
+        self.replay_speed = replay_speed
+        self.random = random.Random(seed)
+        # Injected events, so a client can tell them from slow but healthy answers
+        self.counts = collections.Counter()
+        self._counts_lock = threading.Lock()
+
+    def count(self, event):
+        with self._counts_lock:
+            self.counts[event] += 1
+
+    def synthetic_chunks(self):
+        """(delay, text) pairs for the canned answer at the configured rate."""
+        tokens = tokenize(SYNTHETIC_ANSWER)
+        if self.max_tokens:
+            tokens = tokens[:self.max_tokens]
+        interval = 1.0 / self.token_rate if self.token_rate > 0 else 0.0
+        chunks = []
+        for i, token in enumerate(tokens):
+            delay = self.latency if i == 0 else interval
+            if self.jitter:
+                delay *= 1 + self.random.uniform(-self.jitter, self.jitter)
+            chunks.append([max(delay, 0.0), token])
+        return chunks
+
+
+def groq_chunk(text, model, finish_reason=None):
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "delta": {"content": text} if text else {},
+            "finish_reason": finish_reason,
+        }],
+    }
+
+
+def gemini_chunk(text, finish_reason=None):
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if finish_reason:
+        candidate["finishReason"] = finish_reason
+    return {"candidates": [candidate]}
+
+
+def extract_text(provider, event):
+    """Text carried by one upstream streaming event, for recording."""
+    try:
+        if provider == "groq":
+            return event["choices"][0]["delta"].get("content") or ""
+        return "".join(p.get("text", "") for p in event["candidates"][0]["content"]["parts"])
+    except (KeyError, IndexError, TypeError):
+        return ""
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = MockConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _inject_failure(self):
+        if self.config.random.random() < self.config.failure_rate:
+            status = self.config.random.choice([429, 500, 503])
+            self._send_json(status, {"error": {"code": status, "message": "Injected failure"}},
+                            headers={"Retry-After": "1"} if status == 429 else None)
+            return True
+        return False
+
+    def do_GET(self):
+        if self.path.endswith(".rss"):
+            body = ('<?xml version="1.0" encoding="UTF-8"?>\n<rss version="2.0"><channel>\n'
+                    "  <title>Mock legal news</title>\n"
+                    + "".join(RSS_ITEM.format(n=n) for n in range(20))
+                    + "</channel></rss>\n").encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/rss+xml")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        body = self._read_body()
+        if path.endswith("/chat/completions"):
+            provider, model = "groq", body.get("model", "mock")
+            stream = body.get("stream", False)
+        elif ":streamGenerateContent" in path or ":generateContent" in path:
+            provider = "gemini"
+            model = path.rsplit("/", 1)[-1].split(":", 1)[0]
+            stream = ":streamGenerateContent" in path
+        else:
+            self._send_json(404, {"error": "not found"})
+            return
+
+        if self._inject_failure():
+            return
+
+        try:
+            if self.config.mode == "record":
+                self._record(provider, body)
+            else:
+                self._respond(provider, model, body, stream)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client cancelled the stream; nothing left to do
+            pass
+
+    def _chunks_for(self, provider, body):
+        if self.config.mode == "replay":
+            record = self.config.store.get(request_key(provider, body))
+            if record:
+                speed = self.config.replay_speed or 1.0
+                return [[delay / speed, text] for delay, text in record["chunks"]]
+        return self.config.synthetic_chunks()
+
+    def _respond(self, provider, model, body, stream):
+        chunks = self._chunks_for(provider, body)
+        if not stream:
+            time.sleep(sum(delay for delay, _ in chunks))
+            text = "".join(t for _, t in chunks)
+            if provider == "groq":
+                payload = {
+                    "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                                 "finish_reason": "stop"}],
+                }
+            else:
+                payload = gemini_chunk(text, "STOP")
+            self._send_json(200, payload)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        fail_at = None
+        if self.config.random.random() < self.config.stream_failure_rate:
+            fail_at = self.config.random.randrange(max(len(chunks), 1))
+
+        for i, (delay, text) in enumerate(chunks):
+            if fail_at is not None and i == fail_at:
+                # Drop the connection mid-stream, like a provider hiccup. The SDKs
+                # end the stream quietly, so the app answers 200 with a cut-off text
+                self.config.count("streams_cut")
+                self.wfile.flush()
+                return
+            time.sleep(delay)
+            event = groq_chunk(text, model) if provider == "groq" else gemini_chunk(text)
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+            self.wfile.flush()
+
+        if provider == "groq":
+            self.wfile.write(f"data: {json.dumps(groq_chunk('', model, 'stop'))}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _record(self, provider, body):
+        import requests
+
+        upstream = GROQ_UPSTREAM if provider == "groq" else GEMINI_UPSTREAM
+        headers = {"Content-Type": "application/json"}
+        for name in ("Authorization", "x-goog-api-key"):
+            if self.headers.get(name):
+                headers[name] = self.headers[name]
+
+        started = time.monotonic()
+        upstream_response = requests.post(upstream + self.path, json=body, headers=headers, stream=True)
+        self.send_response(upstream_response.status_code)
+        self.send_header("Content-Type", upstream_response.headers.get("Content-Type", "application/json"))
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        chunks = []
+        last = started
+        with upstream_response:
+            for line in upstream_response.iter_lines():
+                self.wfile.write(line + b"\n")
+                self.wfile.flush()
+                if not line.startswith(b"data: ") or line == b"data: [DONE]":
+                    continue
+                text = extract_text(provider, json.loads(line[len(b"data: "):]))
+                if text:
+                    now = time.monotonic()
+                    chunks.append([round(now - last, 4), text])
+                    last = now
+
+        if upstream_response.ok and chunks:
+            self.config.store.save(request_key(provider, body), provider, chunks)
+
+
+def start_server(config, host="127.0.0.1", port=0):
+    """Start the mock server on a background thread and return it."""
+    handler = type("ConfiguredMockLLMHandler", (MockLLMHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_config_arguments(parser):
+    parser.add_argument("--mode", choices=["synthetic", "record", "replay"], default="synthetic")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="tokens per second")
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--jitter", type=float, default=0.0, help="relative jitter on every delay, e.g. 0.2")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of requests answered with 429/5xx")
+    parser.add_argument("--stream-failure-rate", type=float, default=0.0,
+                        help="share of streams dropped part-way through")
+    parser.add_argument("--max-tokens", type=int, default=None, help="cap on synthetic answer length")
+    parser.add_argument("--transcripts", default="bench/transcripts.jsonl")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="replay time multiplier")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args):
+    return MockConfig(
+        mode=args.mode, token_rate=args.token_rate, latency=args.latency, jitter=args.jitter,
+        failure_rate=args.failure_rate, stream_failure_rate=args.stream_failure_rate,
+        max_tokens=args.max_tokens, transcripts=args.transcripts,
+        replay_speed=args.replay_speed, seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Gemini/Groq server for offline benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_server(config_from_args(args), args.host, args.port)
+    print(f"Mock LLM server ({args.mode}) listening on http://{args.host}:{server.server_port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
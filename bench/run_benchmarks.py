@@ -0,0 +1,373 @@
+"""
+End-to-end performance benchmarks against the mock LLM server.
+
+Boots the app under gunicorn once per worker config, with Groq, Gemini and the
+news feed pointed at bench/mock_llm.py, then drives /upload, /stream_analysis,
+/chat_api and /api/news concurrently. Reports p50/p95/p99 latency,
+time-to-first-token (for streaming routes), throughput and worker cold start.
+
+The app answers 200 even when a provider call fails, so a request counts as
+an error when its body is the app's error text or when the mock cut its
+stream short. Gemini-to-Groq fallbacks are counted from the app's log.
+
+Needs a reachable MongoDB set in the shell as MONGO_URI, on localhost or
+with "test" or "bench" in the database name. Without it the app would read
+.env, which normally points at production. A throwaway bench user is
+registered on every run and removed afterwards. No provider network access
+is used.
+
+Usage:
+    python -m bench.run_benchmarks --workers sync:1 sync:4 gthread:2x32
+    python -m bench.run_benchmarks --json bench_output.json --baseline bench/baseline.json
+"""
+import argparse
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from bench.mock_llm import add_config_arguments, config_from_args, start_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_PDF = os.path.join(ROOT, "Data", "clausePDF1.pdf")
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "[::1]"}
+
+SAMPLE_CONTRACT = """
+RENTAL AGREEMENT. This agreement is made on 1 April 2025 between the Landlord and the Tenant.
+1. The Tenant shall pay a monthly rent of Rs. 15,000 on or before the 5th day of each month.
+2. A late fee of Rs. 500 per day shall be payable for any delay in payment of rent.
+3. The Landlord may terminate this agreement at its sole discretion by giving one month's notice.
+4. This agreement shall automatically renew for a further period of 11 months unless terminated.
+5. Any dispute shall be referred to arbitration, the seat of arbitration shall be Mumbai.
+""" * 8
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile; None for an empty sample."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100.0 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def parse_worker_config(spec):
+    """'sync:4' -> 4 sync workers, 'gthread:2x8' -> 2 workers with 8 threads each."""
+    worker_class, _, size = spec.partition(":")
+    workers, _, threads = (size or "1").partition("x")
+    return {"name": spec, "worker_class": worker_class, "workers": int(workers), "threads": int(threads or 1)}
+
+
+def start_app(worker, port, env, log_path=None):
+    """
+    Launch gunicorn and return (process, seconds until the first request was served).
+    With `log_path` the app's output is appended to that file.
+    """
+    cmd = [
+        sys.executable, "-m", "gunicorn",
+        "--bind", f"127.0.0.1:{port}",
+        "--worker-class", worker["worker_class"],
+        "--workers", str(worker["workers"]),
+        "--threads", str(worker["threads"]),
+        "--timeout", "120",
+        "app:app",
+    ]
+    started = time.monotonic()
+    if log_path:
+        with open(log_path, "ab") as log:
+            process = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    else:
+        process = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    deadline = started + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            if log_path:
+                with open(log_path, "rb") as log:
+                    output = log.read()
+            else:
+                output = process.stderr.read()
+            raise RuntimeError(f"gunicorn exited early:\n{output.decode(errors='replace')}")
+        try:
+            # The master binds before workers have imported the app, so this blocks until one is ready
+            if requests.get(f"http://127.0.0.1:{port}/login", timeout=30).status_code == 200:
+                return process, time.monotonic() - started
+        except requests.RequestException:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("gunicorn did not start within 60s")
+
+
+def is_test_database(mongo_uri):
+    """True for a URI whose hosts are all local or whose database name says test or bench."""
+    rest = mongo_uri.split("://", 1)[-1]
+    hosts, _, path = rest.partition("/")
+    hosts = hosts.rsplit("@", 1)[-1].split(",")
+    database = path.split("?", 1)[0].lower()
+    # Drop the port, keeping a bracketed IPv6 address whole
+    local = all((host if host.endswith("]") else host.rsplit(":", 1)[0]) in LOCAL_HOSTS for host in hosts)
+    return local or "test" in database or "bench" in database
+
+
+def remove_user(mongo_uri, email):
+    """Delete the bench user and its quota document."""
+    from pymongo import MongoClient
+    client = MongoClient(mongo_uri, serverSelectionTimeoutMS=5000)
+    try:
+        db = client.get_default_database("legalclause")
+        user = db.users.find_one_and_delete({"email": email})
+        if user:
+            db.llm_quotas.delete_one({"_id": str(user["_id"])})
+    finally:
+        client.close()
+
+
+def login(base_url):
+    """Register and log in a throwaway user; returns (session cookies, email)."""
+    session = requests.Session()
+    email = f"bench-{uuid.uuid4().hex[:12]}@example.invalid"
+    password = uuid.uuid4().hex
+    session.post(f"{base_url}/register", data={"email": email, "password": password})
+    response = session.post(f"{base_url}/login", data={"email": email, "password": password},
+                            allow_redirects=False)
+    if response.status_code != 302 or "/login" in response.headers.get("Location", ""):
+        raise RuntimeError("Could not log in the bench user; is MongoDB reachable?")
+    return session.cookies, email
+
+
+def is_error_answer(body):
+    """
+    The app streams a failed provider call as text with status 200:
+    "Error calling Groq API: ..." (possibly after part of the answer) or "Error: ...".
+    """
+    text = body.decode("utf-8", errors="replace").lstrip()
+    return text.startswith("Error") or "Error calling " in text
+
+
+def timed_request(session, method, url, stream=False, **kwargs):
+    """Returns (ok, total seconds, seconds to first body byte or None)."""
+    started = time.monotonic()
+    ttft = None
+    response = session.request(method, url, stream=stream, allow_redirects=False, timeout=300, **kwargs)
+    with response:
+        if stream:
+            parts = []
+            for chunk in response.iter_content(chunk_size=None):
+                if chunk and ttft is None:
+                    ttft = time.monotonic() - started
+                parts.append(chunk)
+            body = b"".join(parts)
+        else:
+            body = response.content
+    return response.ok and not is_error_answer(body), time.monotonic() - started, ttft
+
+
+def scenario_requests(base_url):
+    def upload(session):
+        if os.path.exists(SAMPLE_PDF):
+            with open(SAMPLE_PDF, "rb") as f:
+                return timed_request(session, "POST", f"{base_url}/upload",
+                                     files={"file": ("clausePDF1.pdf", f, "application/pdf")})
+        return timed_request(session, "POST", f"{base_url}/upload", data={"text": SAMPLE_CONTRACT})
+
+    def stream_analysis(session):
+        return timed_request(session, "POST", f"{base_url}/stream_analysis", stream=True,
+                             json={"text": SAMPLE_CONTRACT})
+
+    def chat_api(session):
+        history = [
+            {"role": "user", "content": "Can my landlord evict me without notice?"},
+            {"role": "model", "content": "Generally no; the agreement and state rent laws require notice."},
+        ]
+        return timed_request(session, "POST", f"{base_url}/chat_api", stream=True,
+                             json={"message": "Is a Rs. 500 per day late fee legal?", "history": history})
+
+    def news(session):
+        return timed_request(session, "GET", f"{base_url}/api/news?category=national")
+
+    return {"upload": upload, "stream_analysis": stream_analysis, "chat_api": chat_api, "news": news}
+
+
+def run_scenario(call, cookies, total, concurrency):
+    def worker(_):
+        session = requests.Session()
+        session.cookies.update(cookies)
+        try:
+            return call(session)
+        except requests.RequestException:
+            return False, None, None
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(worker, range(total)))
+    elapsed = time.monotonic() - started
+
+    latencies = [r[1] for r in results if r[0]]
+    ttfts = [r[2] for r in results if r[0] and r[2] is not None]
+    return {
+        "requests": total,
+        "errors": sum(1 for r in results if not r[0]),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "p99_s": percentile(latencies, 99),
+        "ttft_p50_s": percentile(ttfts, 50),
+        "ttft_p95_s": percentile(ttfts, 95),
+    }
+
+
+def count_in_file(path, needle, offset):
+    """(occurrences of `needle` after byte `offset`, new offset) in a growing log file."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    return data.count(needle), offset + len(data)
+
+
+def benchmark_worker(worker, mock, args):
+    mock_url = f"http://127.0.0.1:{mock.server_port}"
+    mock_counts = mock.RequestHandlerClass.config.counts
+    env = dict(os.environ)
+    env.update({
+        # The fallback notices are print()ed; without this they reach the log late
+        "PYTHONUNBUFFERED": "1",
+        "GROQ_KEY": env.get("GROQ_KEY") or "bench",
+        "GAISTUDIO_KEY": env.get("GAISTUDIO_KEY") or "bench",
+        "GROQ_BASE_URL": mock_url,
+        "GEMINI_BASE_URL": mock_url + "/",
+        "NEWS_FEED_BASE_URL": mock_url,
+    })
+    # One bench user drives all the load, so per-user quotas would only measure 429s
+    for name, value in [("LLM_USER_REQUESTS_PER_MINUTE", "1000000"), ("LLM_USER_TOKENS_PER_MINUTE", "1000000000"),
+                        ("LLM_MAX_QUEUED_PER_USER", "1000"), ("LLM_MAX_QUEUE", "1000")]:
+        env.setdefault(name, value)
+    port = free_port()
+    log_dir = tempfile.TemporaryDirectory(prefix="bench-")
+    log_path = os.path.join(log_dir.name, "gunicorn.log")
+    process, startup_s = start_app(worker, port, env, log_path)
+    base_url = f"http://127.0.0.1:{port}"
+    email = None
+    try:
+        cookies, email = login(base_url)
+        results = {"startup_s": round(startup_s, 3), "scenarios": {}}
+        _, log_offset = count_in_file(log_path, b"", 0)
+        for name, call in scenario_requests(base_url).items():
+            if args.scenarios and name not in args.scenarios:
+                continue
+            cut_before = mock_counts["streams_cut"]
+            result = run_scenario(call, cookies, args.requests, args.concurrency)
+            # A cut stream still ends in a 200 with part of the answer, so it is only known to the mock
+            result["streams_cut"] = mock_counts["streams_cut"] - cut_before
+            result["errors"] += result["streams_cut"]
+            result["fallbacks"], log_offset = count_in_file(log_path, b"falling back to Groq", log_offset)
+            results["scenarios"][name] = result
+        return results
+    finally:
+        if email:
+            remove_user(env["MONGO_URI"], email)
+        process.terminate()
+        process.wait(timeout=30)
+        log_dir.cleanup()
+
+
+def format_seconds(value):
+    return "-" if value is None else f"{value * 1000:.0f}ms"
+
+
+def print_report(report):
+    header = (f"{'worker':<14}{'scenario':<17}{'p50':>8}{'p95':>8}{'p99':>8}{'ttft50':>8}{'ttft95':>8}"
+              f"{'rps':>8}{'err':>5}{'fb':>5}")
+    print(header)
+    print("-" * len(header))
+    for worker_name, result in report["workers"].items():
+        for name, s in result["scenarios"].items():
+            print(f"{worker_name:<14}{name:<17}{format_seconds(s['p50_s']):>8}{format_seconds(s['p95_s']):>8}"
+                  f"{format_seconds(s['p99_s']):>8}{format_seconds(s['ttft_p50_s']):>8}"
+                  f"{format_seconds(s['ttft_p95_s']):>8}{s['throughput_rps'] or 0:>8.1f}{s['errors']:>5}"
+                  f"{s['fallbacks']:>5}")
+        print(f"{worker_name:<14}{'(cold start)':<17}{format_seconds(result['startup_s']):>8}")
+
+
+def find_regressions(report, baseline, max_regression):
+    """Compare p95 latency and cold start against a previous report."""
+    regressions = []
+    for worker_name, result in report["workers"].items():
+        previous = baseline.get("workers", {}).get(worker_name)
+        if not previous:
+            continue
+        pairs = [("startup_s", result["startup_s"], previous.get("startup_s"))]
+        for name, s in result["scenarios"].items():
+            old = previous.get("scenarios", {}).get(name, {})
+            pairs.append((f"{name}.p95_s", s["p95_s"], old.get("p95_s")))
+            pairs.append((f"{name}.ttft_p95_s", s["ttft_p95_s"], old.get("ttft_p95_s")))
+        for metric, new, old in pairs:
+            if new is not None and old and new > old * (1 + max_regression):
+                regressions.append(f"{worker_name} {metric}: {old:.3f}s -> {new:.3f}s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmarks for LegalClauseAI")
+    parser.add_argument("--workers", nargs="+", default=["sync:1", "sync:4", "gthread:2x32"],
+                        help="gunicorn worker configs, e.g. sync:4 or gthread:2x32")
+    parser.add_argument("--scenarios", nargs="*", help="subset of upload, stream_analysis, chat_api, news")
+    parser.add_argument("--requests", type=int, default=40, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="previous --json report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="allowed relative p95 slowdown before failing")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    # Checked here, because the app falls back to .env (normally the production database)
+    mongo_uri = os.environ.get("MONGO_URI")
+    if not mongo_uri:
+        parser.error("set MONGO_URI to a local or test MongoDB; the app would otherwise use the one in .env")
+    if not is_test_database(mongo_uri):
+        parser.error("MONGO_URI must point at localhost or a database named *test* or *bench*; "
+                     "every run registers a bench user there")
+
+    mock = start_server(config_from_args(args))
+    mock_url = f"http://127.0.0.1:{mock.server_port}"
+
+    report = {"mock": {"mode": args.mode, "token_rate": args.token_rate, "latency": args.latency,
+                       "failure_rate": args.failure_rate, "stream_failure_rate": args.stream_failure_rate},
+              "requests": args.requests, "concurrency": args.concurrency, "workers": {}}
+    try:
+        for spec in args.workers:
+            worker = parse_worker_config(spec)
+            report["workers"][worker["name"]] = benchmark_worker(worker, mock, args)
+    finally:
+        mock.shutdown()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = find_regressions(report, json.load(f), args.max_regression)
+        if regressions:
+            print("\nRegressions beyond {:.0%}:".format(args.max_regression))
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
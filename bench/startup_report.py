@@ -0,0 +1,164 @@
+"""
+Startup-time report: what importing the app costs, and how long gunicorn
+takes from launch to the first served request.
+
+The import profile comes from `python -X importtime -c "import app"` in a
+fresh interpreter. Provider SDKs and document parsers are meant to load on
+first use, so the report fails if any of them is imported eagerly, if the
+import exceeds --max-import-ms, or if a metric regresses against --baseline.
+
+No MongoDB or provider access is needed: the app connects lazily and
+/login renders without touching the database.
+
+Usage:
+    python -m bench.startup_report
+    python -m bench.startup_report --workers sync:1 sync:4 --json startup.json --baseline bench/startup_baseline.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from bench.run_benchmarks import ROOT, free_port, parse_worker_config, start_app
+
+# Modules that should only be imported by the request that needs them
+LAZY_MODULES = [
+    "google.genai", "groq", "PyPDF2", "docx", "PIL", "pytesseract",
+    "feedparser", "markdown", "numpy", "requests",
+]
+
+
+def app_env():
+    env = dict(os.environ)
+    # Never contacted during startup; only needs to parse
+    env.setdefault("MONGO_URI", "mongodb://127.0.0.1:27017/legalclause")
+    return env
+
+
+def import_profile(module="app", env=None):
+    """
+    Parse `-X importtime` output for importing `module` in a fresh interpreter.
+    Returns one dict per imported module: name, depth, self_us, cumulative_us.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env or app_env(), capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        stripped = name.lstrip()
+        entries.append({
+            "name": stripped,
+            "depth": (len(name) - len(stripped) - 1) // 2,
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+        })
+    return entries
+
+
+def summarize_imports(entries, module="app", top=10):
+    """Total import time of `module`, its costliest direct imports and any eager lazy modules."""
+    total = next((e["cumulative_us"] for e in entries if e["name"] == module and e["depth"] == 0), 0)
+    direct = sorted((e for e in entries if e["depth"] == 1), key=lambda e: e["cumulative_us"], reverse=True)
+    names = {e["name"] for e in entries}
+    return {
+        "import_ms": round(total / 1000, 1),
+        "top_imports": [{"name": e["name"], "ms": round(e["cumulative_us"] / 1000, 1)} for e in direct[:top]],
+        "eager_lazy_modules": [m for m in LAZY_MODULES if m in names],
+    }
+
+
+def measure_cold_start(worker, runs):
+    """Seconds from launching gunicorn to the first served GET /login, one sample per run."""
+    samples = []
+    for _ in range(runs):
+        process, startup_s = start_app(worker, free_port(), app_env())
+        process.terminate()
+        process.wait(timeout=30)
+        samples.append(round(startup_s, 3))
+    return samples
+
+
+def print_report(report):
+    imports = report["imports"]
+    print(f"import app: {imports['import_ms']:.1f}ms (median of {report['import_runs']})")
+    for item in imports["top_imports"]:
+        print(f"  {item['name']:<32}{item['ms']:>8.1f}ms")
+    if imports["eager_lazy_modules"]:
+        print(f"  eagerly imported: {', '.join(imports['eager_lazy_modules'])}")
+    for worker_name, samples in report["cold_start"].items():
+        print(f"cold start {worker_name:<14}{statistics.median(samples) * 1000:>8.0f}ms  (runs: {samples})")
+
+
+def find_problems(report, baseline, max_import_ms, max_regression):
+    problems = []
+    imports = report["imports"]
+    if imports["eager_lazy_modules"]:
+        problems.append(f"imported at startup: {', '.join(imports['eager_lazy_modules'])}")
+    if max_import_ms and imports["import_ms"] > max_import_ms:
+        problems.append(f"import app took {imports['import_ms']:.1f}ms (budget {max_import_ms:.0f}ms)")
+    if baseline:
+        pairs = [("import_ms", imports["import_ms"], baseline.get("imports", {}).get("import_ms"))]
+        for worker_name, samples in report["cold_start"].items():
+            old = baseline.get("cold_start", {}).get(worker_name)
+            pairs.append((f"{worker_name} cold start", statistics.median(samples),
+                          statistics.median(old) if old else None))
+        for metric, new, old in pairs:
+            if old and new > old * (1 + max_regression):
+                problems.append(f"{metric}: {old:.3f} -> {new:.3f}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time and cold-start report for LegalClauseAI")
+    parser.add_argument("--workers", nargs="*", default=["sync:1"],
+                        help="gunicorn worker configs to cold-start, e.g. sync:4 or gthread:2x8")
+    parser.add_argument("--runs", type=int, default=3, help="samples per measurement")
+    parser.add_argument("--top", type=int, default=10, help="direct imports to list")
+    parser.add_argument("--max-import-ms", type=float, default=500,
+                        help="fail if importing the app takes longer (0 disables)")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="previous --json report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="allowed relative slowdown before failing")
+    args = parser.parse_args()
+
+    # Median of several fresh interpreters; the first run also warms the bytecode cache
+    import_profile()
+    summaries = [summarize_imports(import_profile(), top=args.top) for _ in range(args.runs)]
+    summaries.sort(key=lambda s: s["import_ms"])
+    report = {
+        "import_runs": args.runs,
+        "imports": summaries[len(summaries) // 2],
+        "cold_start": {},
+    }
+    for spec in args.workers:
+        worker = parse_worker_config(spec)
+        report["cold_start"][worker["name"]] = measure_cold_start(worker, args.runs)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    problems = find_problems(report, baseline, args.max_import_ms, args.max_regression)
+    if problems:
+        print("\nStartup checks failed:")
+        for line in problems:
+            print(f"  {line}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+# Picked up automatically by gunicorn when started from the project root.
+import gc
+import os
+
+# Import the app once in the master and fork workers from it, so a worker
+# boot is a fork rather than a fresh import, and the Constitution text
+# loaded by create_app() is shared copy-on-write.
+preload_app = True
+os.environ.setdefault("PRELOAD_CORPUS", "1")
+
+# Threaded workers: LLM answers stream for seconds, and the fair-share
+# scheduler (parser/scheduler.py) only queues calls that run concurrently
+# within one worker. With sync workers only the per-user quotas apply.
+# Every streaming answer and every queued call holds a thread, so there are
+# enough for LLM_MAX_CONCURRENT calls, a queue and page loads besides.
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "32"))
+
+
+def post_fork(server, worker):
+    # The app is already imported (preloaded); fit its LLM queue to this worker
+    from app import scheduler
+    scheduler.fit_threads(worker.cfg.threads)
+
+
+def pre_fork(server, worker):
+    # Keep the collector from touching (and so copying) the preloaded objects
+    gc.freeze()
@@ -1,36 +1,71 @@
 import os
-from google import genai
-from google.genai import types
-from dotenv import load_dotenv
-import PyPDF2
+import threading
 
-from groq import Groq
-
-load_dotenv()
-
-# Prevent 'proxies' error in Gemini SDK
-for var in ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy']:
-    os.environ.pop(var, None)
+from parser.providers import gemini_client, gemini_types, groq_client
+from parser.token_budget import plan_request
 
 CONSTITUTION_PATH = os.path.join(os.path.dirname(__file__), "..", "Documentation", "Constitution_of_India_2024_EnglishVersion.pdf")
+# Extracting first 50 pages for faster loading and to stay safe with context
+CONSTITUTION_PAGES = 50
+# Extracted text is cached on disk; the Dockerfile builds it into the image
+CORPUS_CACHE_PATH = os.environ.get("CORPUS_CACHE_PATH", CONSTITUTION_PATH + ".txt")
 
 _constitution_text = None
+_constitution_lock = threading.Lock()
+
+def _corpus_cache_key():
+    stat = os.stat(CONSTITUTION_PATH)
+    return f"{stat.st_size}:{stat.st_mtime_ns}:{CONSTITUTION_PAGES}"
+
+def _read_corpus_cache(key):
+    try:
+        with open(CORPUS_CACHE_PATH, encoding="utf-8") as f:
+            if f.readline().rstrip("\n") == key:
+                return f.read()
+    except OSError:
+        pass
+    return None
+
+def _write_corpus_cache(key, text):
+    try:
+        with open(CORPUS_CACHE_PATH, "w", encoding="utf-8") as f:
+            f.write(key + "\n" + text)
+    except OSError as e:
+        print(f"Could not cache constitution text: {e}")
+
+def _extract_constitution_text():
+    import PyPDF2
+    with open(CONSTITUTION_PATH, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        text = ""
+        num_pages = min(CONSTITUTION_PAGES, len(reader.pages))
+        for i in range(num_pages):
+            page_text = reader.pages[i].extract_text()
+            if page_text:
+                text += page_text + "\n"
+    return text
 
 def get_constitution_text():
+    """
+    Text of the Constitution, loaded once per process. PDF extraction takes
+    seconds, so the result is cached on disk next to the PDF. create_app()
+    can load it up front so that under `gunicorn --preload` the master reads
+    it once and every forked worker shares the same copy.
+    """
     global _constitution_text
-    if _constitution_text is None:
+    if _constitution_text is not None:
+        return _constitution_text
+    with _constitution_lock:
+        if _constitution_text is not None:
+            return _constitution_text
         if os.path.exists(CONSTITUTION_PATH):
             try:
-                with open(CONSTITUTION_PATH, "rb") as f:
-                    reader = PyPDF2.PdfReader(f)
-                    text = ""
-                    # Extracting first 50 pages for faster loading and to stay safe with context
-                    num_pages = min(50, len(reader.pages))
-                    for i in range(num_pages):
-                        page_text = reader.pages[i].extract_text()
-                        if page_text:
-                            text += page_text + "\n"
-                    _constitution_text = text
+                key = _corpus_cache_key()
+                text = _read_corpus_cache(key)
+                if text is None:
+                    text = _extract_constitution_text()
+                    _write_corpus_cache(key, text)
+                _constitution_text = text
             except Exception as e:
                 print(f"Error reading constitution: {e}")
                 _constitution_text = ""
@@ -39,26 +74,39 @@ def get_constitution_text():
             _constitution_text = ""
     return _constitution_text
 
-def chat_with_groq_stream(message, history=None, system_instruction=""):
+def with_reference_material(system_instruction, context):
+    if not context:
+        return system_instruction
+    return system_instruction + f"\n\nREFERENCE MATERIAL (Constitution of India):\n{context}"
+
+def chat_with_groq_stream(message, history=None, system_instruction="", context="", route="groq_chat", on_plan=None):
+    """
+    Stream a Groq chat answer. `on_plan` is called with the token budget
+    plan before the request is sent (e.g. Ticket.charge for the quota).
+    """
     api_key = os.environ.get("GROQ_KEY")
     if not api_key:
         yield "Error: Groq API key (GROQ_KEY) not found in environment."
         return
 
-    client = Groq(api_key=api_key)
-    
-    messages = [{"role": "system", "content": system_instruction}]
-    if history:
-        for msg in history:
-            role = "user" if msg.get('role') == 'user' else "assistant"
-            messages.append({"role": role, "content": msg.get('content', '')})
+    client = groq_client(api_key)
+    plan = plan_request("groq", system_instruction, context, history, message, route=route)
+    if on_plan:
+        on_plan(plan)
+
+    messages = [{"role": "system", "content": with_reference_material(plan.system, plan.context)}]
+    for msg in plan.history:
+        role = "user" if msg.get('role') == 'user' else "assistant"
+        messages.append({"role": role, "content": msg.get('content', '')})
     
-    messages.append({"role": "user", "content": message})
+    messages.append({"role": "user", "content": plan.user})
 
+    completion = None
     try:
         completion = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
+            model=plan.model,
             messages=messages,
+            max_tokens=plan.tokens["output_reserve"],
             stream=True,
         )
         for chunk in completion:
@@ -66,8 +114,12 @@ def chat_with_groq_stream(message, history=None, system_instruction=""):
                 yield chunk.choices[0].delta.content
     except Exception as e:
         yield f"Error calling Groq API: {str(e)}"
+    finally:
+        # Runs on GeneratorExit too, so a cancelled client aborts the upstream call
+        if completion is not None:
+            completion.close()
 
-def chat_with_gemini_stream(message, history=None):
+def chat_with_gemini_stream(message, history=None, on_plan=None):
     api_key = os.environ.get("GAISTUDIO_KEY")
     
     keywords = ["legal", "right", "law", "constitution", "article", "illegal", "allowed", "permit", "my right", "is it legal"]
@@ -81,45 +133,51 @@ def chat_with_gemini_stream(message, history=None):
     Keep your answers concise, professional, and easy to understand for a layperson.
     """
     
-    if is_legal_query:
-        constitution_context = get_constitution_text()
-        if constitution_context:
-            system_instruction += f"\n\nREFERENCE MATERIAL (Constitution of India):\n{constitution_context[:15000]}"
+    # Trimmed to each model's token budget below, instead of a fixed character slice
+    constitution_context = get_constitution_text() if is_legal_query else ""
 
     # Try Gemini first
     if api_key:
         try:
-            client = genai.Client(api_key=api_key)
+            client = gemini_client(api_key)
+            types = gemini_types()
+            plan = plan_request("gemini", system_instruction, constitution_context, history, message,
+                                route="gemini_chat")
+            if on_plan:
+                on_plan(plan)
             contents = []
-            if history:
-                for msg in history:
-                    role = "user" if msg.get('role') == 'user' else "model"
-                    contents.append(types.Content(
-                        role=role,
-                        parts=[types.Part(text=msg.get('content', ''))]
-                    ))
+            for msg in plan.history:
+                role = "user" if msg.get('role') == 'user' else "model"
+                contents.append(types.Content(
+                    role=role,
+                    parts=[types.Part(text=msg.get('content', ''))]
+                ))
             
             contents.append(types.Content(
                 role="user",
-                parts=[types.Part(text=message)]
+                parts=[types.Part(text=plan.user)]
             ))
 
-            # Using gemini-1.5-flash (Standard stable model)
-            for chunk in client.models.generate_content_stream(
-                model="gemini-1.5-flash",
+            stream = client.models.generate_content_stream(
+                model=plan.model,
                 contents=contents,
                 config=types.GenerateContentConfig(
-                    system_instruction=system_instruction
+                    system_instruction=with_reference_material(plan.system, plan.context),
+                    max_output_tokens=plan.tokens["output_reserve"],
                 )
-            ):
-                if chunk.candidates:
-                    part = chunk.candidates[0].content.parts[0]
-                    if part.text:
-                        yield part.text
+            )
+            try:
+                for chunk in stream:
+                    if chunk.candidates:
+                        part = chunk.candidates[0].content.parts[0]
+                        if part.text:
+                            yield part.text
+            finally:
+                stream.close()
             return # Success, exit
         except Exception as e:
             print(f"Gemini failed, falling back to Groq: {e}")
             # If Gemini fails, we fall through to Groq
     
     # Fallback to Groq
-    yield from chat_with_groq_stream(message, history, system_instruction)
+    yield from chat_with_groq_stream(message, history, system_instruction, constitution_context, on_plan=on_plan)
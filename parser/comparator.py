@@ -0,0 +1,226 @@
+import difflib
+import re
+import time
+import zlib
+from functools import lru_cache
+
+from parser.risk_analyzer import split_clauses
+
+NUM_PERMUTATIONS = 64
+BANDS = 16  # 16 bands x 4 rows: pairs above ~0.5 similarity almost always become candidates
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+MATCH_THRESHOLD = 0.35
+SHINGLE_SIZE = 3
+# Below this many words one edited word changes most 3-gram shingles, so
+# leftover short clauses are paired by difflib's character ratio instead
+SHORT_CLAUSE_WORDS = 12
+SHORT_MATCH_THRESHOLD = 0.6
+
+_NUMBERING = re.compile(r"^\s*(?:\d+(?:\.\d+)*[.)]|\([a-z0-9]{1,4}\)|(?:clause|article|section)\s+\d+[.:]?)\s*", re.I)
+_WORDS = re.compile(r"[a-z0-9]+")
+
+
+def normalize_clause(clause):
+    """Lower-case words of a clause without its numbering, for equality checks."""
+    return " ".join(_WORDS.findall(_NUMBERING.sub("", clause).lower()))
+
+
+@lru_cache(maxsize=1)
+def _hash_parameters():
+    """
+    (multipliers, offsets) of the MinHash permutations. Fixed seeds keep
+    signatures comparable across workers and requests; numpy is only
+    imported once the first comparison runs.
+    """
+    import numpy as np
+    rng = np.random.default_rng(20240601)
+    multipliers = rng.integers(1, 2**63, size=NUM_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+    offsets = rng.integers(0, 2**63, size=NUM_PERMUTATIONS, dtype=np.uint64)
+    return multipliers, offsets
+
+
+def _shingle_hashes(normalized):
+    words = normalized.split()
+    if len(words) < SHINGLE_SIZE:
+        return [zlib.crc32(normalized.encode())] if normalized else []
+    return [
+        zlib.crc32(" ".join(words[i:i + SHINGLE_SIZE]).encode())
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    ]
+
+
+def minhash_signatures(normalized_clauses):
+    """
+    MinHash signature matrix (clauses x NUM_PERMUTATIONS) for word 3-gram
+    shingles, computed for every shingle of every clause in one numpy pass.
+    Empty clauses get an all-max row, which never matches anything.
+    """
+    import numpy as np
+    multipliers, offsets = _hash_parameters()
+    hashes, owners = [], []
+    for index, normalized in enumerate(normalized_clauses):
+        shingles = _shingle_hashes(normalized)
+        hashes.extend(shingles)
+        owners.extend([index] * len(shingles))
+
+    signatures = np.full((len(normalized_clauses), NUM_PERMUTATIONS), np.iinfo(np.uint64).max, dtype=np.uint64)
+    if not hashes:
+        return signatures
+    values = np.asarray(hashes, dtype=np.uint64)
+    # Multiply-shift hashing; uint64 overflow is the intended modular arithmetic
+    permuted = values[:, None] * multipliers[None, :] + offsets[None, :]
+    np.minimum.at(signatures, np.asarray(owners), permuted)
+    return signatures
+
+
+def _candidate_pairs(signatures_a, signatures_b):
+    """Locality-sensitive hashing: clause pairs that share at least one band."""
+    candidates = set()
+    for band in range(BANDS):
+        columns = slice(band * ROWS_PER_BAND, (band + 1) * ROWS_PER_BAND)
+        buckets = {}
+        for i, row in enumerate(signatures_a[:, columns]):
+            buckets.setdefault(row.tobytes(), []).append(i)
+        for j, row in enumerate(signatures_b[:, columns]):
+            for i in buckets.get(row.tobytes(), ()):
+                candidates.add((i, j))
+    return candidates
+
+
+def _short_clause_pairs(rest_a, rest_b, normalized_a, normalized_b):
+    """(similarity, i, j) for unmatched clause pairs where either side is short."""
+    scored = []
+    for i in rest_a:
+        # SequenceMatcher caches details of its second sequence, so that is the fixed A side
+        matcher = difflib.SequenceMatcher(None, b=normalized_a[i], autojunk=False)
+        short_a = len(normalized_a[i].split()) < SHORT_CLAUSE_WORDS
+        for j in rest_b:
+            if not (short_a or len(normalized_b[j].split()) < SHORT_CLAUSE_WORDS):
+                continue
+            matcher.set_seq1(normalized_b[j])
+            if matcher.real_quick_ratio() < SHORT_MATCH_THRESHOLD or matcher.quick_ratio() < SHORT_MATCH_THRESHOLD:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= SHORT_MATCH_THRESHOLD:
+                scored.append((ratio, i, j))
+    return sorted(scored, reverse=True)
+
+
+def _reading_order(pairs):
+    """
+    Pairs in document A's order. A B-only clause goes after the A position
+    of the B clause just before it, and after any A-only clauses that follow
+    that position, so an added clause comes after the removed one it replaces.
+    """
+    added = {}
+    last_a = -1
+    for pair in sorted((p for p in pairs if p["b"] is not None), key=lambda p: p["b"]):
+        if pair["a"] is None:
+            added.setdefault(last_a, []).append(pair)
+        else:
+            last_a = pair["a"]
+
+    ordered = []
+    pending = added.get(-1, [])
+    for pair in sorted((p for p in pairs if p["a"] is not None), key=lambda p: p["a"]):
+        if pair["b"] is not None:
+            ordered.extend(pending)
+            pending = added.get(pair["a"], [])
+        ordered.append(pair)
+    return ordered + pending
+
+
+def align_documents(text_a, text_b):
+    """
+    Align the clauses of two documents and classify each as identical,
+    changed, removed (only in A) or added (only in B).
+
+    Only candidate pairs found through LSH are scored, so the work grows with
+    the number of similar clauses rather than with len(A) x len(B). Short
+    clauses left over after that are compared directly.
+    """
+    started = time.perf_counter()
+    clauses_a = split_clauses(text_a or "")
+    clauses_b = split_clauses(text_b or "")
+    normalized_a = [normalize_clause(c) for c in clauses_a]
+    normalized_b = [normalize_clause(c) for c in clauses_b]
+
+    # Exact matches (after normalisation) need no hashing at all
+    pairs = []
+    unmatched_b = {}
+    for j, normalized in enumerate(normalized_b):
+        unmatched_b.setdefault(normalized, []).append(j)
+    used_a, used_b = set(), set()
+    for i, normalized in enumerate(normalized_a):
+        if normalized and unmatched_b.get(normalized):
+            j = unmatched_b[normalized].pop(0)
+            used_a.add(i)
+            used_b.add(j)
+            pairs.append({"status": "identical", "a": i, "b": j, "similarity": 1.0})
+
+    rest_a = [i for i in range(len(clauses_a)) if i not in used_a]
+    rest_b = [j for j in range(len(clauses_b)) if j not in used_b]
+    scored = []
+    if rest_a and rest_b:
+        signatures_a = minhash_signatures([normalized_a[i] for i in rest_a])
+        signatures_b = minhash_signatures([normalized_b[j] for j in rest_b])
+        candidates = sorted(_candidate_pairs(signatures_a, signatures_b))
+        if candidates:
+            import numpy as np
+            rows_a, rows_b = np.array(candidates).T
+            similarity = (signatures_a[rows_a] == signatures_b[rows_b]).mean(axis=1)
+            scored = sorted(
+                ((float(s), rest_a[a], rest_b[b]) for s, a, b in zip(similarity, rows_a, rows_b)
+                 if s >= MATCH_THRESHOLD),
+                reverse=True,
+            )
+
+    # Greedy one-to-one alignment, most similar pairs first
+    def pair_greedily(scored):
+        for similarity, i, j in scored:
+            if i in used_a or j in used_b:
+                continue
+            used_a.add(i)
+            used_b.add(j)
+            pairs.append({"status": "changed", "a": i, "b": j, "similarity": round(similarity, 3)})
+
+    pair_greedily(scored)
+    pair_greedily(_short_clause_pairs([i for i in rest_a if i not in used_a],
+                                      [j for j in rest_b if j not in used_b], normalized_a, normalized_b))
+    pairs.extend({"status": "removed", "a": i, "b": None, "similarity": 0.0}
+                 for i in range(len(clauses_a)) if i not in used_a)
+    pairs.extend({"status": "added", "a": None, "b": j, "similarity": 0.0}
+                 for j in range(len(clauses_b)) if j not in used_b)
+
+    pairs = _reading_order(pairs)
+    for pair in pairs:
+        pair["text_a"] = clauses_a[pair["a"]] if pair["a"] is not None else ""
+        pair["text_b"] = clauses_b[pair["b"]] if pair["b"] is not None else ""
+
+    stats = {"identical": 0, "changed": 0, "removed": 0, "added": 0}
+    for pair in pairs:
+        stats[pair["status"]] += 1
+    return {
+        "pairs": pairs,
+        "stats": stats,
+        "clauses_a": len(clauses_a),
+        "clauses_b": len(clauses_b),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+def format_differences_for_prompt(report):
+    """Only the differing clauses, numbered, for the LLM prompt."""
+    blocks = []
+    number = 0
+    for pair in report["pairs"]:
+        if pair["status"] == "identical":
+            continue
+        number += 1
+        if pair["status"] == "changed":
+            blocks.append(f"### Difference {number} (changed clause)\nDocument A: {pair['text_a']}\nDocument B: {pair['text_b']}")
+        elif pair["status"] == "removed":
+            blocks.append(f"### Difference {number} (only in Document A)\nDocument A: {pair['text_a']}")
+        else:
+            blocks.append(f"### Difference {number} (only in Document B)\nDocument B: {pair['text_b']}")
+    return "\n\n".join(blocks)
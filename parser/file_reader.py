@@ -1,17 +1,12 @@
 import os
-import PyPDF2
-from docx import Document
-from PIL import Image
-import pytesseract
-from google import genai
-from google.genai import types
-from dotenv import load_dotenv
 
-load_dotenv()
+# Each reader imports its parsing library on first use, so workers that never
+# see an image upload never load PIL/pytesseract.
 
 def read_pdf(file):
     """Extract text from a PDF file."""
     try:
+        import PyPDF2
         reader = PyPDF2.PdfReader(file)
         text = ""
         for page in reader.pages:
@@ -25,6 +20,7 @@ def read_pdf(file):
 def read_docx(file):
     """Extract text from a DOCX file."""
     try:
+        from docx import Document
         doc = Document(file)
         text = ""
         for para in doc.paragraphs:
@@ -40,6 +36,9 @@ def read_image(file):
     Note: Requires Tesseract-OCR installed on the system.
     """
     try:
+        from PIL import Image
+        import pytesseract
+
         # Tesseract path configuration
         if os.name == 'nt': # Windows
             tesseract_path = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
@@ -0,0 +1,51 @@
+import os
+
+# The provider SDKs are imported on first use: together they account for most
+# of the app's import time, and a worker should not pay for them before it
+# serves a request that needs them.
+
+PROXY_VARIABLES = ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy']
+
+_environment_loaded = False
+
+
+def load_environment():
+    """
+    Read .env and strip proxy settings, once per process.
+    The proxy variables cause the 'Client.__init__ proxies' error in the
+    Google GenAI SDK, so this must run before any provider client is built.
+    """
+    global _environment_loaded
+    if _environment_loaded:
+        return
+    from dotenv import load_dotenv
+    load_dotenv()
+    for var in PROXY_VARIABLES:
+        os.environ.pop(var, None)
+    _environment_loaded = True
+
+
+def gemini_types():
+    """The google.genai `types` module (request/response schema classes)."""
+    from google.genai import types
+    return types
+
+
+def gemini_client(api_key):
+    """
+    Build a Gemini client. GEMINI_BASE_URL points it at another endpoint
+    (e.g. the local mock server in bench/mock_llm.py).
+    """
+    from google import genai
+    base_url = os.environ.get("GEMINI_BASE_URL")
+    if base_url:
+        return genai.Client(api_key=api_key, http_options={"base_url": base_url})
+    return genai.Client(api_key=api_key)
+
+
+def groq_client(api_key):
+    """
+    Build a Groq client. The SDK itself honours GROQ_BASE_URL.
+    """
+    from groq import Groq
+    return Groq(api_key=api_key)
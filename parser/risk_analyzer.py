@@ -0,0 +1,328 @@
+import datetime
+import re
+import time
+from bisect import bisect_right
+from collections import deque
+
+# category -> (label, severity)
+RISK_CATEGORIES = {
+    "unilateral_termination": ("Unilateral termination", "high"),
+    "unilateral_change": ("One-sided changes", "high"),
+    "penalty": ("Penalty / late fee", "high"),
+    "forfeiture": ("Forfeiture", "high"),
+    "indemnity": ("Indemnity", "high"),
+    "auto_renewal": ("Automatic renewal", "medium"),
+    "lock_in": ("Lock-in period", "medium"),
+    "arbitration": ("Arbitration / jurisdiction", "medium"),
+    "liability_cap": ("Limitation of liability", "medium"),
+    "non_compete": ("Non-compete / restriction", "medium"),
+    "deadline": ("Deadline", "medium"),
+    "confidentiality": ("Confidentiality", "low"),
+}
+
+SEVERITY_WEIGHTS = {"high": 20, "medium": 10, "low": 4}
+# Score of a document that hits every category; each category counts once
+_MAX_CATEGORY_WEIGHT = sum(SEVERITY_WEIGHTS[severity] for _, severity in RISK_CATEGORIES.values())
+
+# Lower-case phrases; whitespace in the document is collapsed before matching
+RISK_LEXICON = {
+    "unilateral_termination": [
+        "sole discretion", "absolute discretion", "terminate this agreement at any time",
+        "terminate at any time", "terminate without notice", "terminate without cause",
+        "terminate without assigning any reason", "without assigning any reason",
+        "terminate forthwith", "terminate with immediate effect", "right to terminate",
+        "may terminate", "reserves the right to terminate",
+    ],
+    "unilateral_change": [
+        "reserves the right to change", "reserves the right to modify", "reserves the right to amend",
+        "may amend", "may modify", "may revise", "at any time without notice",
+        "without prior notice", "subject to change",
+    ],
+    "penalty": [
+        "penalty", "penalties", "liquidated damages", "late fee", "late fees", "late payment charge",
+        "interest at the rate", "penal interest", "compensation of", "fine of",
+    ],
+    "forfeiture": [
+        "forfeit", "forfeited", "forfeiture", "non-refundable", "non refundable", "shall not be refunded",
+    ],
+    "indemnity": [
+        "indemnify", "indemnified", "indemnity", "hold harmless", "keep indemnified",
+    ],
+    "auto_renewal": [
+        "automatically renew", "automatically renewed", "auto-renew", "auto renew", "auto-renewal",
+        "renewed automatically", "deemed to be renewed", "deemed renewed", "shall renew",
+        "evergreen", "unless terminated",
+    ],
+    "lock_in": [
+        "lock-in", "lock in period", "minimum term", "minimum period of",
+    ],
+    "arbitration": [
+        "arbitration", "arbitral tribunal", "arbitrator", "seat of arbitration", "venue of arbitration",
+        "exclusive jurisdiction", "courts at", "governed by the laws of",
+    ],
+    "liability_cap": [
+        "limitation of liability", "shall not be liable", "in no event", "not be responsible",
+        "aggregate liability", "maximum liability", "without any liability",
+    ],
+    "non_compete": [
+        "non-compete", "non compete", "shall not engage", "restrictive covenant", "non-solicitation",
+        "shall not solicit",
+    ],
+    "deadline": [
+        "on or before", "no later than", "not later than", "time is of the essence", "failing which",
+        "prior to the expiry", "within a period of",
+    ],
+    "confidentiality": [
+        "confidential information", "confidentiality", "non-disclosure", "shall not disclose",
+    ],
+}
+
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class PhraseMatcher:
+    """
+    Aho-Corasick automaton over a fixed phrase list: one pass over the text
+    finds every occurrence of every phrase, regardless of lexicon size.
+    """
+
+    def __init__(self, phrases):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for phrase, payload in phrases:
+            state = 0
+            for char in phrase:
+                nxt = self.goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][char] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = nxt
+            self.output[state].append((len(phrase), phrase, payload))
+
+        # Fold failure links into a full transition table so scanning is one dict lookup per char
+        self.delta = [dict(self.goto[0])]
+        self.delta.extend({} for _ in range(len(self.goto) - 1))
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(char, 0)
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+            transitions = dict(self.delta[self.fail[state]]) if state else {}
+            transitions.update(self.goto[state])
+            self.delta[state] = transitions if state else self.delta[0]
+
+    def finditer(self, text):
+        """Yield (start, end, phrase, payload) for whole-word matches in lower-cased `text`."""
+        delta, output = self.delta, self.output
+        size = len(text)
+        state = 0
+        for i, char in enumerate(text):
+            state = delta[state].get(char, 0)
+            if output[state]:
+                for length, phrase, payload in output[state]:
+                    start = i - length + 1
+                    if start > 0 and text[start - 1].isalnum():
+                        continue
+                    if i + 1 < size and text[i + 1].isalnum():
+                        continue
+                    yield start, i + 1, phrase, payload
+
+
+_MATCHER = PhraseMatcher(
+    (phrase, category) for category, phrases in RISK_LEXICON.items() for phrase in phrases
+)
+
+_MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+_MONTH = r"(Jan(?:uary)?|Feb(?:ruary)?|Mar(?:ch)?|Apr(?:il)?|May|June?|July?|Aug(?:ust)?|Sep(?:t(?:ember)?)?|Oct(?:ober)?|Nov(?:ember)?|Dec(?:ember)?)"
+_DATE_PATTERNS = [
+    # 1 April 2025, 1st April, 2025
+    (re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)?\s+(?:day\s+of\s+)?" + _MONTH + r"\.?,?\s+(\d{4})\b", re.I), "dmy"),
+    # April 1, 2025
+    (re.compile(r"(?=[ADFJMNOSadfjmnos])\b" + _MONTH + r"\.?\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})\b", re.I), "mdy"),
+    # 2025-04-01
+    (re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b"), "iso"),
+    # 01/04/2025 (day first, as written in India)
+    (re.compile(r"\b(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})\b"), "numeric"),
+]
+
+_NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "fifteen": 15, "thirty": 30,
+    "forty-five": 45, "sixty": 60, "ninety": 90,
+}
+# The lookaheads give the regex engine a first-character filter, which keeps these scans fast
+_DURATION = re.compile(
+    r"(?=[\dotfesnOTFESN])\b(\d+|" + "|".join(_NUMBER_WORDS) + r")\s*(?:\(\d+\)\s*)?(day|week|month|year)s?\b", re.I
+)
+_DEADLINE = re.compile(r"\b(?:within|before the expiry of|not later than|no later than)\s+", re.I)
+
+_MULTIPLIERS = {"thousand": 1e3, "lakh": 1e5, "lakhs": 1e5, "crore": 1e7, "crores": 1e7, "million": 1e6}
+_AMOUNT = re.compile(
+    # No letter before the currency, so "HOURS 500" is not read as "RS 500"
+    r"(?:(?<![A-Za-z])(?P<cur>R[sS]\.?|INR|₹|USD|US\$|\$)\s*(?P<num>\d[\d,]*(?:\.\d+)?)"
+    r"|(?P<num2>\d[\d,]*(?:\.\d+)?)\s*(?P<cur2>(?i:rupees)|INR))"
+    r"(?:\s*(?:/-)?\s*(?P<mult>(?i:thousand|lakhs?|crores?|million)))?"
+)
+_PERCENT = re.compile(r"\b(\d+(?:\.\d+)?)\s*(?:%|per\s*cent\b|percent\b)(?:\s*per\s+(annum|month|day))?", re.I)
+_SEAT = re.compile(
+    # Keywords are case-insensitive; the place must be capitalised
+    r"(?i:(?:seat|venue|place)\s+of\s+(?:the\s+)?arbitration\s+(?:shall\s+be|will\s+be|is)\s+(?:at\s+|in\s+)?)"
+    r"([A-Z][a-zA-Z]+(?:[ ][A-Z][a-zA-Z]+)?)"
+    r"|(?i:arbitration\s+(?:proceedings\s+)?(?:shall\s+be\s+)?(?:held|conducted)\s+(?:at|in)\s+)([A-Z][a-zA-Z]+)"
+    r"|(?i:courts?\s+(?:at|in|of)\s+)([A-Z][a-zA-Z]+)(?i:\s+(?:alone\s+)?shall\s+have\s+(?:the\s+)?(?:exclusive\s+)?jurisdiction)"
+)
+_CLAUSE_BREAK = re.compile(
+    r"\n\s*\n|\n(?=\s*(?:\d+(?:\.\d+)*[.)]|\([a-z0-9]{1,4}\)|(?:clause|article|section)\s+\d+)\s)"
+    r"|(?<=[.;:])\s+(?=\d{1,2}\.\s+[A-Z])",
+    re.I,
+)
+
+
+def split_clauses(text):
+    """Split a document into clauses on blank lines and clause numbering."""
+    return [c.strip() for c in _CLAUSE_BREAK.split(text) if c and c.strip()]
+
+
+def _parse_date(kind, groups):
+    try:
+        if kind == "dmy":
+            day, month, year = int(groups[0]), _MONTHS[groups[1][:3].lower()], int(groups[2])
+        elif kind == "mdy":
+            month, day, year = _MONTHS[groups[0][:3].lower()], int(groups[1]), int(groups[2])
+        elif kind == "iso":
+            year, month, day = int(groups[0]), int(groups[1]), int(groups[2])
+        else:
+            day, month, year = int(groups[0]), int(groups[1]), int(groups[2])
+        return datetime.date(year, month, day).isoformat()
+    except (KeyError, ValueError):
+        pass
+    return None
+
+
+def _parse_amount(match):
+    number = float((match.group("num") or match.group("num2")).replace(",", ""))
+    multiplier = (match.group("mult") or "").lower()
+    number *= _MULTIPLIERS.get(multiplier, 1)
+    currency = (match.group("cur") or match.group("cur2") or "").upper()
+    currency = "USD" if "$" in currency or currency == "USD" else "INR"
+    return currency, number
+
+
+def _excerpt(text, start, end, width=80):
+    left = text.rfind(" ", 0, start - width) + 1 if start > width else 0
+    right = text.find(" ", end + width)
+    right = len(text) if right == -1 else right
+    return ("..." if left else "") + text[left:right] + ("..." if right < len(text) else "")
+
+
+def analyze_text(text):
+    """
+    Deterministic, local risk scan of a legal document.
+    Returns a JSON-serialisable report of flagged clauses plus the dates,
+    amounts, durations, percentages and arbitration seats found.
+    """
+    started = time.perf_counter()
+    flags, dates, amounts, durations, percentages, seats = [], [], [], [], [], []
+    flagged = set()
+
+    # Scan the whole document once; clauses are joined with "\n", which no
+    # phrase contains, so matches never straddle two clauses
+    clauses = [_WHITESPACE.sub(" ", c) for c in split_clauses(text or "")]
+    starts = []
+    offset = 0
+    for clause in clauses:
+        starts.append(offset)
+        offset += len(clause) + 1
+    flat = "\n".join(clauses)
+
+    def locate(position):
+        index = bisect_right(starts, position) - 1
+        return index, position - starts[index]
+
+    for start, end, phrase, category in _MATCHER.finditer(flat.translate(_ASCII_LOWER)):
+        index, local = locate(start)
+        if (index, category) in flagged:
+            continue
+        flagged.add((index, category))
+        label, severity = RISK_CATEGORIES[category]
+        flags.append({
+            "category": category,
+            "label": label,
+            "severity": severity,
+            "clause": index,
+            "match": flat[start:end],
+            "excerpt": _excerpt(clauses[index], local, local + end - start),
+        })
+
+    for pattern, kind in _DATE_PATTERNS:
+        for m in pattern.finditer(flat):
+            dates.append({"text": m.group(0), "iso": _parse_date(kind, m.groups()), "clause": locate(m.start())[0]})
+    for m in _AMOUNT.finditer(flat):
+        currency, value = _parse_amount(m)
+        amounts.append({"text": m.group(0).strip(), "currency": currency, "value": value,
+                        "clause": locate(m.start())[0]})
+    for m in _DURATION.finditer(flat):
+        count = m.group(1).lower()
+        value = int(count) if count.isdigit() else _NUMBER_WORDS[count]
+        is_deadline = bool(_DEADLINE.search(flat, max(m.start() - 25, 0), m.start()))
+        durations.append({"text": m.group(0), "value": value, "unit": m.group(2).lower(),
+                          "deadline": is_deadline, "clause": locate(m.start())[0]})
+    for m in _PERCENT.finditer(flat):
+        percentages.append({"text": m.group(0), "value": float(m.group(1)),
+                            "period": (m.group(2) or "").lower() or None, "clause": locate(m.start())[0]})
+    # Seats can only appear in clauses the lexicon already flagged for arbitration
+    for index in sorted(i for i, category in flagged if category == "arbitration"):
+        for m in _SEAT.finditer(clauses[index]):
+            place = next(g for g in m.groups() if g)
+            seats.append({"text": m.group(0), "place": place, "clause": index})
+
+    severity_rank = {"high": 0, "medium": 1, "low": 2}
+    flags.sort(key=lambda f: (severity_rank[f["severity"]], f["clause"]))
+    summary = {}
+    for flag in flags:
+        summary[flag["category"]] = summary.get(flag["category"], 0) + 1
+
+    return {
+        # Distinct categories, not flag counts, so long contracts do not all saturate at 100
+        "risk_score": round(100 * sum(SEVERITY_WEIGHTS[RISK_CATEGORIES[c][1]] for c in summary) / _MAX_CATEGORY_WEIGHT),
+        "flags": flags,
+        "summary": summary,
+        "dates": dates,
+        "amounts": amounts,
+        "durations": durations,
+        "percentages": percentages,
+        "arbitration_seats": seats,
+        "clause_count": len(clauses),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+def format_findings_for_prompt(report, limit=15):
+    """Compact bullet list of the local findings, for the LLM prompt."""
+    lines = []
+    for flag in report["flags"][:limit]:
+        lines.append(f"- [{flag['severity'].upper()}] {flag['label']} (clause {flag['clause'] + 1}): \"{flag['excerpt']}\"")
+    facts = []
+    if report["dates"]:
+        facts.append("Dates: " + ", ".join(d["text"] for d in report["dates"][:8]))
+    deadlines = [d["text"] for d in report["durations"] if d["deadline"]]
+    if deadlines:
+        facts.append("Deadlines: " + ", ".join(deadlines[:8]))
+    if report["amounts"]:
+        facts.append("Amounts: " + ", ".join(a["text"] for a in report["amounts"][:8]))
+    if report["arbitration_seats"]:
+        facts.append("Arbitration / jurisdiction: " + ", ".join(s["place"] for s in report["arbitration_seats"]))
+    return "\n".join(lines + [f"- {fact}" for fact in facts])
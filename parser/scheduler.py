@@ -0,0 +1,370 @@
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+
+from parser.streaming import close_stream
+from parser.token_budget import MODEL_TIERS, MODELS, estimate_tokens
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_STANDARD = "standard"
+PRIORITY_BULK = "bulk"
+
+# Share of the queue each class gets while they compete
+PRIORITY_WEIGHTS = {
+    PRIORITY_INTERACTIVE: 8,
+    PRIORITY_STANDARD: 2,
+    PRIORITY_BULK: 1,
+}
+
+LLM_MAX_CONCURRENT = int(os.environ.get("LLM_MAX_CONCURRENT", "8"))
+LLM_MAX_QUEUE = int(os.environ.get("LLM_MAX_QUEUE", "16"))
+LLM_MAX_QUEUED_PER_USER = int(os.environ.get("LLM_MAX_QUEUED_PER_USER", "4"))
+LLM_QUEUE_TIMEOUT = float(os.environ.get("LLM_QUEUE_TIMEOUT", "30"))
+LLM_USER_REQUESTS_PER_MINUTE = int(os.environ.get("LLM_USER_REQUESTS_PER_MINUTE", "20"))
+LLM_USER_TOKENS_PER_MINUTE = int(os.environ.get("LLM_USER_TOKENS_PER_MINUTE", "60000"))
+
+# Requests are sized with the large Groq model, the one the quota matters most for
+SIZING_MODEL = MODEL_TIERS["groq"][1]
+OUTPUT_RESERVE = MODELS[SIZING_MODEL].output_reserve
+# No planned call is larger than the biggest per-call budget
+MAX_REQUEST_TOKENS = max(spec.request_budget for spec in MODELS.values())
+
+
+class QuotaExceeded(Exception):
+    """Raised instead of admitting a request; `retry_after` is in seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(int(math.ceil(retry_after)), 1)
+
+
+class TokenBucket:
+    """Holds up to `capacity` units and refills `capacity` per minute."""
+
+    def __init__(self, capacity, level=None):
+        self.capacity = capacity
+        self.rate = capacity / 60.0
+        self.level = capacity if level is None else min(level, capacity)
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` units are available (0 if they are now)."""
+        self.refill(now)
+        return max(amount - self.level, 0) / self.rate
+
+    def take(self, amount):
+        self.level -= amount
+
+    def give(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+
+class UserState:
+    """Quota buckets, queue position and usage totals of one user."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute, saved=None):
+        saved = saved or {}
+        # Saved levels refill for the time the process was not running
+        idle = max(time.time() - saved.get("updated", time.time()), 0)
+        requests = saved.get("requests")
+        tokens = saved.get("tokens")
+        self.requests = TokenBucket(
+            requests_per_minute,
+            None if requests is None else requests + idle * requests_per_minute / 60.0,
+        )
+        self.tokens = TokenBucket(
+            tokens_per_minute,
+            None if tokens is None else tokens + idle * tokens_per_minute / 60.0,
+        )
+        # Per priority class, like the fair-queuing flows
+        self.queued = {}
+        self.finish_tags = {}
+        self.total_requests = saved.get("total_requests", 0)
+        self.total_tokens = saved.get("total_tokens", 0)
+
+    def snapshot(self):
+        """Bucket levels to persist; usage totals are persisted as increments."""
+        return {
+            "requests": self.requests.level,
+            "tokens": self.tokens.level,
+            "updated": time.time(),
+        }
+
+
+class Ticket:
+    """
+    An admitted call. Holds a provider slot until released; release() is
+    idempotent, so it is safe from both a response close and a `finally`.
+    """
+
+    def __init__(self, scheduler, user, priority, input_tokens, reserved, start_tag):
+        self.scheduler = scheduler
+        self.user = user
+        self.priority = priority
+        self.input_tokens = input_tokens
+        self.reserved = reserved
+        self.start_tag = start_tag
+        self.output_chars = 0
+        self.granted = False
+        self.cancelled = False
+        self.released = False
+        self.started_at = None
+
+    def track(self, chunks):
+        """Pass streamed chunks through, counting output for the token quota."""
+        try:
+            for chunk in chunks:
+                self.output_chars += len(chunk)
+                yield chunk
+        finally:
+            # Pass a client abort on, so the provider call is aborted too
+            close_stream(chunks)
+
+    def charge(self, plan):
+        """
+        Re-size the reservation to the prompt actually sent, from the
+        parser.token_budget plan of the call. A provider fallback plans
+        again, and its plan replaces the first one.
+        """
+        self.scheduler.charge(self, plan)
+
+    def used_tokens(self):
+        # ~4 characters per token, as in parser.token_budget for Latin text
+        return self.input_tokens + math.ceil(self.output_chars / 4)
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.scheduler.release(self)
+
+
+class FairScheduler:
+    """
+    Admission control in front of the LLM providers: per-user request and
+    token quotas, plus weighted fair queuing for a fixed number of slots.
+
+    While all slots are busy, calls wait in a start-time fair queue with one
+    flow per (user, priority), and `max_queued_per_user` applies per flow.
+    A user's batch of analyses therefore only delays (or gets rejected
+    instead of) their own analyses, and chat (weight 8) overtakes bulk work.
+    Only chat may take the last quarter of the queue.
+    Over quota, a full queue or a wait past `queue_timeout` raises
+    QuotaExceeded. State lives in the worker process; with a `store` the
+    quota levels are loaded when a user is first seen and saved after each
+    call, so they survive restarts. Levels are not shared between running
+    workers: each enforces the limits on its own and the last save wins.
+    Usage totals are added atomically, so they do count every worker.
+    """
+
+    def __init__(self, max_concurrent=LLM_MAX_CONCURRENT, max_queue=LLM_MAX_QUEUE,
+                 max_queued_per_user=LLM_MAX_QUEUED_PER_USER, queue_timeout=LLM_QUEUE_TIMEOUT,
+                 requests_per_minute=LLM_USER_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=LLM_USER_TOKENS_PER_MINUTE, store=None):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queued_per_user = max_queued_per_user
+        self.queue_timeout = queue_timeout
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.store = store
+
+        self._cond = threading.Condition()
+        self._users = {}
+        self._waiting = []
+        self._queued = 0
+        self._active = 0
+        self._virtual_time = 0.0
+        self._sequence = itertools.count()
+        # Moving average of how long a call holds its slot, for Retry-After
+        self._service_seconds = 5.0
+
+    def fit_threads(self, threads):
+        """
+        Cap slots and queue to a worker with `threads` request threads.
+
+        A running or queued call holds its thread for as long as it lasts.
+        Requests beyond the thread pool wait in gunicorn's backlog, first
+        come first served, and never reach acquire(). So a quarter of the
+        threads is kept for page loads. Of the rest, at most half run
+        provider calls and the others hold the queue.
+        """
+        llm_threads = threads - max(threads // 4, 1)
+        if llm_threads < 1:
+            # Sync worker: one request at a time, nothing can queue
+            return
+        with self._cond:
+            self.max_concurrent = min(self.max_concurrent, max(llm_threads // 2, 1))
+            self.max_queue = min(self.max_queue, llm_threads - self.max_concurrent)
+
+    def _user_state(self, user):
+        with self._cond:
+            state = self._users.get(user)
+        if state is not None:
+            return state
+        saved = None
+        if self.store is not None:
+            try:
+                saved = self.store.load(user)
+            except Exception as e:
+                print(f"Error loading quota for {user}: {e}")
+        state = UserState(self.requests_per_minute, self.tokens_per_minute, saved)
+        with self._cond:
+            return self._users.setdefault(user, state)
+
+    def _queue_retry_after(self):
+        return self._service_seconds * (self._queued + 1) / self.max_concurrent
+
+    def _dispatch(self, ticket):
+        ticket.granted = True
+        ticket.started_at = time.monotonic()
+        self._active += 1
+        self._virtual_time = max(self._virtual_time, ticket.start_tag)
+
+    def _dispatch_waiting(self):
+        while self._waiting and self._active < self.max_concurrent:
+            ticket = heapq.heappop(self._waiting)[-1]
+            if ticket.cancelled:
+                continue
+            self._queued -= 1
+            self._users[ticket.user].queued[ticket.priority] -= 1
+            self._dispatch(ticket)
+        self._cond.notify_all()
+
+    def acquire(self, user, priority, input_tokens):
+        """
+        Admit a call for `user` whose prompt is about `input_tokens` long,
+        blocking while it is queued. Returns a Ticket to release when the
+        call is over; raises QuotaExceeded instead of admitting it.
+        """
+        weight = PRIORITY_WEIGHTS[priority]
+        # A single call never needs more than a full bucket; Ticket.charge() corrects the estimate
+        reserved = min(input_tokens + OUTPUT_RESERVE, MAX_REQUEST_TOKENS, self.tokens_per_minute)
+        state = self._user_state(user)
+
+        with self._cond:
+            now = time.monotonic()
+            wait = max(state.requests.wait_time(1, now), state.tokens.wait_time(reserved, now))
+            if wait > 0:
+                raise QuotaExceeded("You have reached your AI usage limit for now.", wait)
+            busy = self._active >= self.max_concurrent or self._queued > 0
+            queued = state.queued.get(priority, 0)
+            queue_limit = self.max_queue
+            if priority != PRIORITY_INTERACTIVE:
+                # A quarter of the queue is kept for chat, so a backlog of analyses cannot turn it away
+                queue_limit -= max(self.max_queue // 4, 1)
+            if busy and (self._queued >= queue_limit or queued >= self.max_queued_per_user):
+                raise QuotaExceeded("The AI service is busy.", self._queue_retry_after())
+
+            state.requests.take(1)
+            state.tokens.take(reserved)
+            # Start-time fair queuing; each of the user's priority classes is its own flow
+            start_tag = max(self._virtual_time, state.finish_tags.get(priority, 0.0))
+            state.finish_tags[priority] = start_tag + reserved / weight
+            ticket = Ticket(self, user, priority, input_tokens, reserved, start_tag)
+
+            if not busy:
+                self._dispatch(ticket)
+                return ticket
+
+            heapq.heappush(self._waiting, (start_tag, -weight, next(self._sequence), ticket))
+            self._queued += 1
+            state.queued[priority] = queued + 1
+            deadline = now + self.queue_timeout
+            while not ticket.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # Left in the heap and skipped when popped
+                    ticket.cancelled = True
+                    self._queued -= 1
+                    state.queued[priority] -= 1
+                    state.requests.give(1)
+                    state.tokens.give(reserved)
+                    raise QuotaExceeded("The AI service is busy.", self._queue_retry_after())
+                self._cond.wait(remaining)
+            return ticket
+
+    def charge(self, ticket, plan):
+        """Replace the ticket's reservation with the planned prompt plus output reserve."""
+        tokens = plan.tokens
+        input_tokens = tokens["system"] + tokens["context"] + tokens["history"] + tokens["user"]
+        reserved = input_tokens + tokens["output_reserve"]
+        with self._cond:
+            state = self._users[ticket.user]
+            # May overdraw the bucket; the user's next call then waits for the refill
+            if reserved > ticket.reserved:
+                state.tokens.take(reserved - ticket.reserved)
+            else:
+                state.tokens.give(ticket.reserved - reserved)
+            ticket.input_tokens = input_tokens
+            ticket.reserved = reserved
+
+    def release(self, ticket):
+        """Free the ticket's slot, refund unused reserved tokens and admit waiting calls."""
+        with self._cond:
+            state = self._users[ticket.user]
+            used = ticket.used_tokens()
+            state.tokens.give(max(ticket.reserved - used, 0))
+            state.total_requests += 1
+            state.total_tokens += used
+            self._active -= 1
+            elapsed = time.monotonic() - ticket.started_at
+            self._service_seconds = 0.8 * self._service_seconds + 0.2 * elapsed
+            self._dispatch_waiting()
+            snapshot = state.snapshot()
+        if self.store is not None:
+            try:
+                self.store.save(ticket.user, snapshot, used)
+            except Exception as e:
+                print(f"Error saving quota for {ticket.user}: {e}")
+
+    def usage(self, user):
+        """Remaining quota of `user` and the current queue, for display."""
+        state = self._user_state(user)
+        with self._cond:
+            now = time.monotonic()
+            state.requests.refill(now)
+            state.tokens.refill(now)
+            return {
+                "requests_remaining": int(state.requests.level),
+                "requests_per_minute": self.requests_per_minute,
+                "tokens_remaining": int(state.tokens.level),
+                "tokens_per_minute": self.tokens_per_minute,
+                "queued": sum(state.queued.values()),
+                "total_requests": state.total_requests,
+                "total_tokens": state.total_tokens,
+                "active_calls": self._active,
+                "queue_length": self._queued,
+            }
+
+
+class MongoQuotaStore:
+    """Persists quota levels and usage totals, one document per user."""
+
+    def __init__(self, collection):
+        # A callable, so the database is only touched once a quota is needed
+        self.collection = collection
+
+    def load(self, user):
+        return self.collection().find_one({"_id": user})
+
+    def save(self, user, snapshot, used_tokens):
+        self.collection().update_one(
+            {"_id": user},
+            {"$set": snapshot, "$inc": {"total_requests": 1, "total_tokens": used_tokens}},
+            upsert=True,
+        )
+
+
+def estimate_input_tokens(*texts):
+    """
+    Approximate prompt size of a call from its user-supplied texts, for
+    admission only: the call's plan replaces it through Ticket.charge().
+    """
+    return sum(estimate_tokens(text, SIZING_MODEL) for text in texts if text)
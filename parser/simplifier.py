@@ -1,26 +1,10 @@
 import os
-from google import genai
-from google.genai import types
-from groq import Groq
-from dotenv import load_dotenv
-load_dotenv()
+from parser.providers import gemini_client, gemini_types, groq_client
+from parser.token_budget import plan_request
+from parser.risk_analyzer import format_findings_for_prompt
+from parser.comparator import format_differences_for_prompt
 
-# Prevent 'proxies' error in Gemini SDK
-for var in ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy']:
-    os.environ.pop(var, None)
-
-def simplify_text_stream(text):
-    """
-    Simplify legal text using Google Gemini with Groq fallback.
-    """
-    gemini_key = os.environ.get("GAISTUDIO_KEY")
-    groq_key = os.environ.get("GROQ_KEY")
-
-    # Truncate text to stay within token limits (approx 30,000 characters)
-    # This avoids the "Request too large" error on Groq's free tier.
-    truncated_text = text[:30000]
-
-    prompt = f"""
+SIMPLIFY_PROMPT = """
 You are an expert legal simplifier. Your task is to summarize the provided legal document into a short, easy-to-read guide for a layperson.
 
 **Goal:** Reduce the document to its absolute essentials. The user will NOT read a long output.
@@ -54,14 +38,71 @@ You are an expert legal simplifier. Your task is to summarize the provided legal
 4.  **Skip procedural minutiae** (like internal office procedures) unless it affects the user directly.
 5.  **Maximum Length:** Keep the total output under 400 words if possible, unless the document is massive and complex.
 
-Legal Text to Simplify:
-{truncated_text}
+{flagged}Legal Text to Simplify:
+{text}
 """
 
+FLAGGED_ITEMS_NOTE = """**Pre-screened risk items** (found by a local rule-based scan of the document):
+{findings}
+
+Base the "Exclusions / Risks" and "Important Dates" sections on these items, explaining each in one plain sentence.
+Do not re-list the whole document; mention an unlisted risk only if it is serious. Keep the total output under 300 words.
+
+"""
+
+COMPARE_PROMPT = """
+You are an expert legal advisor comparing two versions of a legal document (Document A and Document B) for a layperson.
+{identical} clauses are identical in both documents and are not shown. Only the differing clauses are listed below.
+
+**Output format:**
+
+| # | Topic | Document A | Document B | What it means for you |
+|---|-------|------------|------------|-----------------------|
+
+One row per difference, in the order given. Keep each cell under 25 words and use plain English.
+After the table, add **⚖️ Which is better for you?** with at most 3 bullet points.
+
+Differences:
+{differences}
+"""
+
+def build_simplify_prompt(text, provider, risk_report=None):
+    """
+    Fit the document into the provider's token budget (picking a smaller model
+    for short documents) and return (budget plan, prompt).
+    """
+    findings = format_findings_for_prompt(risk_report) if risk_report else ""
+    flagged = FLAGGED_ITEMS_NOTE.format(findings=findings) if findings else ""
+    plan = plan_request(provider, system=SIMPLIFY_PROMPT.format(flagged=flagged, text=""), user=text,
+                        route=f"simplify_{provider}")
+    return plan, SIMPLIFY_PROMPT.format(flagged=flagged, text=plan.user)
+
+def build_compare_prompt(report, provider):
+    """Budget the differing clause pairs for the provider and return (budget plan, prompt)."""
+    stats = report["stats"]
+    system = COMPARE_PROMPT.format(identical=stats["identical"], differences="")
+    plan = plan_request(provider, system=system, user=format_differences_for_prompt(report),
+                        route=f"compare_{provider}")
+    return plan, COMPARE_PROMPT.format(identical=stats["identical"], differences=plan.user)
+
+def _stream_prompt(build_prompt, task, on_plan=None):
+    """
+    Stream a single-turn prompt from Gemini, falling back to Groq.
+    `build_prompt(provider)` returns (budget plan, prompt) for that provider;
+    the plan's output cap is enforced on the call, and the plan is passed
+    to `on_plan` before each request is sent.
+    """
+    gemini_key = os.environ.get("GAISTUDIO_KEY")
+    groq_key = os.environ.get("GROQ_KEY")
+
     # Try Gemini first
     if gemini_key:
         try:
-            client = genai.Client(api_key=gemini_key)
+            client = gemini_client(gemini_key)
+            types = gemini_types()
+            plan, prompt = build_prompt("gemini")
+            if on_plan:
+                on_plan(plan)
             contents = [
                 types.Content(
                     role="user",
@@ -69,29 +110,38 @@ Legal Text to Simplify:
                 )
             ]
 
-            for chunk in client.models.generate_content_stream(
-                model="gemini-1.5-flash",
+            stream = client.models.generate_content_stream(
+                model=plan.model,
                 contents=contents,
-            ):
-                if chunk.candidates:
-                    candidate = chunk.candidates[0]
-                    if candidate.content and candidate.content.parts:
-                        part = candidate.content.parts[0]
-                        if part.text:
-                            yield part.text
+                config=types.GenerateContentConfig(max_output_tokens=plan.tokens["output_reserve"]),
+            )
+            try:
+                for chunk in stream:
+                    if chunk.candidates:
+                        candidate = chunk.candidates[0]
+                        if candidate.content and candidate.content.parts:
+                            part = candidate.content.parts[0]
+                            if part.text:
+                                yield part.text
+            finally:
+                stream.close()
             return # Success
         except Exception as e:
-            print(f"Gemini simplification failed, falling back to Groq: {e}")
+            print(f"Gemini {task} failed, falling back to Groq: {e}")
 
     # Fallback to Groq
     if groq_key:
+        completion = None
         try:
-            client = Groq(api_key=groq_key)
-            # Using llama-3.1-8b-instant for fallback as it has higher rate limits
-            # but llama-3.3-70b-versatile is also fine if we truncate.
+            client = groq_client(groq_key)
+            # Groq's per-request limit is much smaller, so the prompt is re-budgeted
+            plan, prompt = build_prompt("groq")
+            if on_plan:
+                on_plan(plan)
             completion = client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
+                model=plan.model,
                 messages=[{"role": "user", "content": prompt}],
+                max_tokens=plan.tokens["output_reserve"],
                 stream=True,
             )
             for chunk in completion:
@@ -99,9 +149,31 @@ Legal Text to Simplify:
                     yield chunk.choices[0].delta.content
         except Exception as e:
             yield f"Error calling Groq API: {str(e)}"
+        finally:
+            if completion is not None:
+                completion.close()
     else:
         yield "Error: No API keys found for Gemini or Groq."
 
+def simplify_text_stream(text, risk_report=None, on_plan=None):
+    """
+    Simplify legal text using Google Gemini with Groq fallback.
+    `risk_report` (from parser.risk_analyzer) focuses the model on the
+    locally flagged clauses, which keeps the answer short.
+    """
+    yield from _stream_prompt(lambda provider: build_simplify_prompt(text, provider, risk_report),
+                              "simplification", on_plan)
+
+def compare_documents_stream(report, on_plan=None):
+    """
+    Explain the differences found by parser.comparator.align_documents.
+    Identical clauses never reach the model, so cost follows the diff size.
+    """
+    if not any(pair["status"] != "identical" for pair in report["pairs"]):
+        yield "The two documents have the same clauses; no differences were found."
+        return
+    yield from _stream_prompt(lambda provider: build_compare_prompt(report, provider), "comparison", on_plan)
+
 def simplify_text(text):
     """
     Wrapper for non-streaming usage.
@@ -110,6 +182,8 @@ def simplify_text(text):
 
 
 if __name__ == "__main__":
+    from parser.providers import load_environment
+    load_environment()
     sample_text = """
     THIS AGREEMENT is made between the parties herein and sets forth the obligations and liabilities.
     """
@@ -0,0 +1,162 @@
+import json
+import re
+
+_LIST_ITEM = re.compile(r"([*+-]|\d+[.)])\s")
+
+
+def _list_type(line):
+    """'ul' or 'ol' for an unindented list item, None for any other line."""
+    match = _LIST_ITEM.match(line)
+    if not match:
+        return None
+    return "ul" if match.group(1) in "*+-" else "ol"
+
+
+def sse_event(event, data):
+    """
+    Format a single server-sent event frame with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# GFM-style tables (the compare prompt asks for one) and ``` code blocks, which
+# MarkdownBlockTracker keeps whole, and single newlines as <br>
+MARKDOWN_EXTENSIONS = ["tables", "fenced_code", "sane_lists", "nl2br"]
+
+
+def render_markdown(source):
+    """HTML for a markdown block; the markdown package is loaded on first use."""
+    import markdown
+    return markdown.markdown(source, extensions=MARKDOWN_EXTENSIONS)
+
+
+class MarkdownBlockTracker:
+    """
+    Collects streamed markdown and reports blocks (headings, paragraphs, lists)
+    as soon as they are complete, so the client can render them incrementally
+    instead of re-parsing the whole answer on every token.
+    """
+
+    def __init__(self):
+        self.pending = ""
+        self.lines = []
+        self.in_fence = False
+        self.index = 0
+
+    def _close_block(self):
+        if not self.lines:
+            return []
+        source = "\n".join(self.lines)
+        self.lines = []
+        first = source.lstrip()
+        if first.startswith("#"):
+            kind = "heading"
+        elif _LIST_ITEM.match(first):
+            kind = "list"
+        elif first.startswith("```"):
+            kind = "code"
+        elif first.startswith("|"):
+            kind = "table"
+        else:
+            kind = "paragraph"
+        block = {
+            "index": self.index,
+            "kind": kind,
+            "markdown": source,
+            "html": render_markdown(source),
+        }
+        self.index += 1
+        return [block]
+
+    def _feed_line(self, line):
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            self.lines.append(line)
+            self.in_fence = not self.in_fence
+            return [] if self.in_fence else self._close_block()
+        if self.in_fence:
+            self.lines.append(line)
+            return []
+        if not stripped:
+            return self._close_block()
+        if stripped.startswith("#"):
+            blocks = self._close_block()
+            self.lines.append(line)
+            return blocks + self._close_block()
+        # Python-Markdown needs a blank line before a list; LLMs often omit it
+        # ("**Key points:**\n- a\n- b"), so a list starts a block of its own
+        list_type = _list_type(line)
+        if list_type and self.lines and _list_type(self.lines[0]) != list_type:
+            blocks = self._close_block()
+            self.lines.append(line)
+            return blocks
+        self.lines.append(line)
+        return []
+
+    def feed(self, chunk):
+        """Add a streamed chunk and return the blocks it completed."""
+        self.pending += chunk
+        blocks = []
+        while "\n" in self.pending:
+            line, self.pending = self.pending.split("\n", 1)
+            blocks.extend(self._feed_line(line))
+        return blocks
+
+    def flush(self):
+        """Return whatever is left once the stream has ended."""
+        blocks = []
+        if self.pending:
+            blocks.extend(self._feed_line(self.pending))
+            self.pending = ""
+        return blocks + self._close_block()
+
+
+def close_stream(chunks):
+    """
+    Close an upstream generator so its provider call is aborted.
+    Safe to call on plain iterables and on already-exhausted generators.
+    """
+    close = getattr(chunks, "close", None)
+    if close:
+        close()
+
+
+def stream_markdown_sse(chunks):
+    """
+    Relay LLM chunks as SSE: a `token` event per chunk, a `render` event per
+    completed markdown block and a final `done` event with the full text.
+    If the client disconnects, the generator is closed and the upstream
+    LLM stream is closed with it.
+    """
+    tracker = MarkdownBlockTracker()
+    parts = []
+    try:
+        for chunk in chunks:
+            parts.append(chunk)
+            yield sse_event("token", {"text": chunk})
+            for block in tracker.feed(chunk):
+                yield sse_event("render", block)
+        for block in tracker.flush():
+            yield sse_event("render", block)
+        yield sse_event("done", {"text": "".join(parts)})
+    finally:
+        close_stream(chunks)
+
+
+def stream_json_sse(chunks, parse):
+    """
+    Relay LLM chunks as SSE `token` events, then emit the structured answer
+    as a `result` event (or an `error` event if `parse` fails).
+    """
+    parts = []
+    try:
+        for chunk in chunks:
+            parts.append(chunk)
+            yield sse_event("token", {"text": chunk})
+        try:
+            yield sse_event("result", parse("".join(parts)))
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+        yield sse_event("done", {})
+    finally:
+        close_stream(chunks)
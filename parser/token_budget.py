@@ -0,0 +1,178 @@
+import logging
+import math
+import os
+import re
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+
+class ModelSpec:
+    """
+    Budget-relevant facts about a model.
+    `request_budget` is the cap on prompt + output tokens per call that
+    plan_request fills, not the full context window. `tokens_per_minute` is
+    the provider's free-tier rate limit, shared by every call to the model;
+    the per-call budget is kept well under it, so one call cannot use up
+    the minute for all users.
+    `latin_chars` / `other_chars` are characters per token for Latin-script
+    words and for other scripts (e.g. Devanagari) in that model's tokenizer.
+    """
+
+    def __init__(self, provider, request_budget, tokens_per_minute, output_reserve, latin_chars, other_chars):
+        self.provider = provider
+        self.request_budget = request_budget
+        self.tokens_per_minute = tokens_per_minute
+        self.output_reserve = output_reserve
+        self.latin_chars = latin_chars
+        self.other_chars = other_chars
+
+
+MODELS = {
+    # Gemini's SentencePiece vocabulary covers Indic scripts well
+    "gemini-1.5-flash": ModelSpec("gemini", 16000, 1000000, 2048, 4.0, 2.5),
+    "gemini-1.5-flash-8b": ModelSpec("gemini", 8000, 1000000, 2048, 4.0, 2.5),
+    # Llama 3 BPE splits non-Latin text into roughly one token per character.
+    # Groq's free tier allows only 12000 / 6000 tokens per minute, so a call gets half
+    "llama-3.3-70b-versatile": ModelSpec("groq", 6000, 12000, 2048, 4.0, 1.2),
+    "llama-3.1-8b-instant": ModelSpec("groq", 3000, 6000, 2048, 4.0, 1.2),
+}
+
+# (small, large) model per provider; the small one is used for short inputs
+MODEL_TIERS = {
+    "gemini": ("gemini-1.5-flash-8b", "gemini-1.5-flash"),
+    "groq": ("llama-3.1-8b-instant", "llama-3.3-70b-versatile"),
+}
+
+SMALL_MODEL_MAX_TOKENS = int(os.environ.get("SMALL_MODEL_MAX_TOKENS", "1500"))
+
+# ASCII words, digit runs, non-ASCII runs, then single punctuation marks
+_PIECES = re.compile(r"[A-Za-z]+|[0-9]+|[^\x00-\x7f\s]+|[^\sA-Za-z0-9]")
+_LATIN_WORDS = re.compile(r"[A-Za-z]+")
+_DIGITS = re.compile(r"[0-9]+")
+_OTHER_SCRIPT = re.compile(r"[^\x00-\x7f\s]+")
+_PUNCTUATION = re.compile(r"[^\sA-Za-z0-9\x80-\U0010ffff]")
+
+
+def _piece_tokens(piece, spec):
+    first = piece[0]
+    if "0" <= first <= "9":
+        return math.ceil(len(piece) / 3)
+    if first.isascii():
+        return math.ceil(len(piece) / spec.latin_chars) if first.isalpha() else 1
+    return math.ceil(len(piece) / spec.other_chars)
+
+
+@lru_cache(maxsize=32)
+def estimate_tokens(text, model):
+    """
+    Fast local approximation of the token count of `text` for `model`.
+    Deliberately errs slightly high so budgets never overflow. Cached, since
+    the same reference text (the Constitution) is sized on every chat turn.
+    """
+    if not text:
+        return 0
+    spec = MODELS[model]
+    latin, other = spec.latin_chars, spec.other_chars
+    # Llama/Gemini tokenizers group at most three digits per token
+    count = sum(-(-len(w) // 3) for w in _DIGITS.findall(text))
+    count += sum(math.ceil(len(w) / latin) for w in _LATIN_WORDS.findall(text))
+    count += sum(math.ceil(len(w) / other) for w in _OTHER_SCRIPT.findall(text))
+    return count + len(_PUNCTUATION.findall(text))
+
+
+def truncate_to_tokens(text, max_tokens, model):
+    """Cut `text` to at most `max_tokens` estimated tokens, on a piece boundary."""
+    if not text or max_tokens <= 0:
+        return ""
+    spec = MODELS[model]
+    used = 0
+    for m in _PIECES.finditer(text):
+        used += _piece_tokens(m.group(), spec)
+        if used > max_tokens:
+            return text[:m.start()].rstrip()
+    return text
+
+
+def choose_model(provider, input_tokens):
+    """Pick the provider's small model for short inputs that fit its budget, the large one otherwise."""
+    small, large = MODEL_TIERS[provider]
+    spec = MODELS[small]
+    fits = input_tokens + spec.output_reserve <= spec.request_budget
+    return small if input_tokens <= SMALL_MODEL_MAX_TOKENS and fits else large
+
+
+class BudgetPlan:
+    """The model and (possibly trimmed) prompt parts that fit its budget."""
+
+    def __init__(self, model, system, context, history, user, tokens):
+        self.model = model
+        self.system = system
+        self.context = context
+        self.history = history
+        self.user = user
+        self.tokens = tokens
+
+
+def plan_request(provider, system="", context="", history=None, user="", route="", output_reserve=None):
+    """
+    Choose a model by input size and split its budget across the prompt parts.
+
+    System prompt and user input are kept whole when possible (user input is
+    truncated only if it alone would overflow, e.g. a long document). History
+    is kept newest-first up to half of what remains, always starting at a
+    user turn, and retrieved context gets the rest, including any share
+    history did not use.
+    """
+    history = history or []
+    # Size the request with the large model's tokenizer; both tiers share one per provider
+    sizing_model = MODEL_TIERS[provider][1]
+    history_tokens = [estimate_tokens(msg.get("content", ""), sizing_model) for msg in history]
+    input_tokens = (estimate_tokens(system, sizing_model) + estimate_tokens(user, sizing_model)
+                    + estimate_tokens(context, sizing_model) + sum(history_tokens))
+    model = choose_model(provider, input_tokens)
+    spec = MODELS[model]
+    reserve = spec.output_reserve if output_reserve is None else output_reserve
+
+    available = spec.request_budget - reserve
+    system_tokens = estimate_tokens(system, model)
+    user_tokens = estimate_tokens(user, model)
+    if system_tokens + user_tokens > available:
+        user = truncate_to_tokens(user, available - system_tokens, model)
+        user_tokens = estimate_tokens(user, model)
+    remaining = max(available - system_tokens - user_tokens, 0)
+
+    kept = []
+    history_budget = remaining // 2
+    history_used = 0
+    for msg, tokens in zip(reversed(history), reversed(history_tokens)):
+        if history_used + tokens > history_budget:
+            break
+        kept.append((msg, tokens))
+        history_used += tokens
+    kept.reverse()
+    # Gemini rejects multi-turn contents that do not open with a user turn
+    while kept and kept[0][0].get("role") != "user":
+        history_used -= kept.pop(0)[1]
+    kept = [msg for msg, _ in kept]
+
+    context_budget = remaining - history_used
+    context_tokens = estimate_tokens(context, model)
+    if context_tokens > context_budget:
+        context = truncate_to_tokens(context, context_budget, model)
+        context_tokens = estimate_tokens(context, model)
+
+    tokens = {
+        "system": system_tokens,
+        "context": context_tokens,
+        "history": history_used,
+        "user": user_tokens,
+        "output_reserve": reserve,
+        "budget": spec.request_budget,
+    }
+    logger.info(
+        "budget route=%s model=%s input=%d system=%d context=%d history=%d/%d msgs user=%d reserve=%d budget=%d",
+        route or "-", model, input_tokens, system_tokens, context_tokens,
+        len(kept), len(history), user_tokens, reserve, spec.request_budget,
+    )
+    return BudgetPlan(model, system, context, kept, user, tokens)